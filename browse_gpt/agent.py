@@ -1,33 +1,106 @@
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 import logging
-from typing import List, Tuple
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
 import undetected_chromedriver as uc
 
 from .cache.action import ActionSpec, ElementActionType
-from .prompt.interface import describe_selection, filter_context, get_text_input_for_field
+from .prompt.interface import describe_selection, stream_filter_context, get_text_input_for_field
 from .cache.util import get_group_context_for_page_id, update_group_description_for_page_id, get_context_for_page_id
-from .cache.page import new_page
-from .cache.element import add_elements, add_filtered_elements, get_filtered_elements
-from .processing import extract_first_interactive_from_outer_html, is_text_input, parse_page_source, DecoratedSoup, is_interactive_element
+from .cache.page import new_page, get_page_id
+from .cache.element import add_elements, add_evaluated_elements, add_filtered_elements, get_filtered_elements, get_filtered_contents, get_element_content
+from .processing import element_from_outer_html, resolve_first_interactive, is_text_input, parse_page_source, DecoratedSoup, is_interactive_element
+from .browser.resolver import ResolvedElement
 from .config import BrowingSessionConfig
-from .util import timer
+from .ranking import rank_contexts
+from .prefetch import PagePrefetcher, get_link_hrefs
+from .util import timer, hash_text, StageTimings
 
 logger = logging.getLogger(__name__)
 
+# runs db writes and page persistence alongside parsing and LLM filtering
+PIPELINE_WORKERS = 4
+PIPELINE_EXECUTOR = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="agent-pipeline")
+
+
+"""Elements from the last parse of a page keyed by (xpath, subtree hash), so a re-parse after an action
+only adds and filters the subtrees that changed"""
+@dataclass
+class ParsedPage:
+    page_id: int
+    element_ids: Dict[Tuple[str, str], int]
+    num_elements: int
+
+
+def get_subtree_keys(elements: List[DecoratedSoup]) -> List[Tuple[str, str]]:
+    return [(e.xpath, e.subtree_hash or hash_text(e.outer_html)) for e in elements]
+
+
+"""Element ids may be a future while the elements are still being inserted"""
+def resolve_element_ids(element_ids: Union[List[int], Future]) -> List[int]:
+    if isinstance(element_ids, Future):
+        return element_ids.result()
+    return element_ids
+
+
+"""Select from element ids without waiting for them to be inserted"""
+def select_element_ids(element_ids: Union[List[int], Future], idxs: List[int]) -> Union[List[int], Future]:
+    if not isinstance(element_ids, Future):
+        return [element_ids[i] for i in idxs]
+    selected = Future()
+    def select(f: Future):
+        if f.exception() is not None:
+            selected.set_exception(f.exception())
+        else:
+            selected.set_result([f.result()[i] for i in idxs])
+    element_ids.add_done_callback(select)
+    return selected
+
 
 def select_and_run_action(
     driver: uc.Chrome,
     config: BrowingSessionConfig,
     element_ids: List[int],
     xpaths: List[str],
+    prefetcher: PagePrefetcher = None,
 ) -> Tuple[int, ActionSpec, str]:  # TODO query llm for description and selection from full/summarized HTML content
+    # resolve interactive elements for all candidates in one round trip
+    resolved = resolve_first_interactive(driver, xpaths)
+    if prefetcher is not None and get_link_hrefs(resolved):
+        prefetcher.prefetch_links(prefetcher.read_session(driver), resolved)
+    return run_first_resolved_action(driver=driver, config=config, candidates=zip(element_ids, xpaths, resolved))
+
+
+"""Run an action on the first filtered element that can be interacted with. `filtered` yields
+(element id, xpath) pairs and may be a stream, in which case later elements are only read if needed
+and each is resolved as it arrives.
+With a `prefetcher`, pages linked from candidates are fetched and parsed while the action runs and the next page loads"""
+def run_first_action(
+    driver: uc.Chrome,
+    config: BrowingSessionConfig,
+    filtered: Iterable[Tuple[int, str]],
+    prefetcher: PagePrefetcher = None,
+) -> Tuple[int, ActionSpec, str]:
+    def resolve_candidates() -> Iterator[Tuple[int, str, ResolvedElement]]:
+        session = None
+        for element_id, xpath in filtered:
+            resolved = resolve_first_interactive(driver, [xpath])
+            if prefetcher is not None and get_link_hrefs(resolved):
+                # the browser's session is read once, on the first link candidate
+                session = session or prefetcher.read_session(driver)
+                prefetcher.prefetch_links(session, resolved)
+            yield element_id, xpath, resolved[0]
+    return run_first_resolved_action(driver=driver, config=config, candidates=resolve_candidates())
+
+
+def run_first_resolved_action(
+    driver: uc.Chrome,
+    config: BrowingSessionConfig,
+    candidates: Iterable[Tuple[int, str, ResolvedElement]],
+) -> Tuple[int, ActionSpec, str]:
     # try to execute for action for filtered xpaths
-    for element_id, xpath in zip(element_ids, xpaths):
-        e = driver.find_element(by=By.XPATH, value=xpath)
-        try:
-            interactive_e = extract_first_interactive_from_outer_html(e)
-        except NoSuchElementException:
+    for element_id, xpath, interactive_e in candidates:
+        if interactive_e is None:
             logger.warning(f"Failed to find interactive element at xpath: {xpath}")
             continue
         input_text = None
@@ -47,7 +120,7 @@ def select_and_run_action(
         # run the action    
         try:
             logger.info(f"Running action: {action_spec}")
-            action_spec.run(driver=driver, e=interactive_e)
+            action_spec.run(driver=driver, e=interactive_e.element)
             logger.info("Done.")
             return element_id, action_spec, ""
         except Exception as e:
@@ -60,16 +133,69 @@ def get_potential_actions(
     session_id: int,
     task_id: int,
     url: str,
-):
-    # add cache page HTML and add to db
-    page_id, cached = new_page(config=config, session_id=session_id, url=url, content=page_source)
+    parsed_pages: Dict[int, ParsedPage] = None,
+    prefetcher: PagePrefetcher = None,
+) -> Tuple[List[int], List[DecoratedSoup], List[str]]:
+    filtered = list(stream_potential_actions(
+        config=config,
+        page_source=page_source,
+        session_id=session_id,
+        task_id=task_id,
+        url=url,
+        parsed_pages=parsed_pages,
+        prefetcher=prefetcher,
+    ))
+    filtered_element_ids, filtered_elems, filtered_xpaths = zip(*filtered) if filtered else ([], [], [])
+    return filtered_element_ids, filtered_elems, filtered_xpaths
 
-    if not cached:
-        # parse page for LLM context
-        elems = parse_page_source(page_source)
 
-        # add parsed elements to db
-        element_ids = add_elements(db_client=config.db_client, page_id=page_id, elements=elems)
+"""Yield (element id, element, xpath) for filtered elements as the LLM response streams in, so actions can be
+tried before filtering completes. Filtered elements are added to the db once the response is complete, including
+when the generator is closed early.
+New pages are saved while they are parsed, and their elements are inserted while the LLM filters them, since element
+ids are only needed once it responds. New pages already parsed by `prefetcher` are not parsed again.
+Pages parsed while `parsed_pages` is given are recorded in it, and are re-parsed incrementally when seen again"""
+def stream_potential_actions(
+    config: BrowingSessionConfig,
+    page_source: str,
+    session_id: int,
+    task_id: int,
+    url: str,
+    parsed_pages: Dict[int, ParsedPage] = None,
+    prefetcher: PagePrefetcher = None,
+) -> Iterator[Tuple[int, DecoratedSoup, str]]:
+    page_id = get_page_id(config=config, session_id=session_id, url=url)
+
+    if page_id is None:
+        timings = StageTimings()
+
+        # add cache page HTML and add to db while the page is parsed
+        page = PIPELINE_EXECUTOR.submit(
+            timings.timed("new_page", new_page),
+            config=config,
+            session_id=session_id,
+            url=url,
+            content=page_source,
+        )
+
+        # parse page for LLM context, unless it was parsed ahead of time
+        elems = prefetcher.pop(url) if prefetcher is not None else None
+        if elems is None:
+            with timings.stage("parse"):
+                elems = parse_page_source(page_source, parser=config.parser, max_nodes=config.max_nodes, compact=True)
+
+        # add parsed elements to db while the LLM filters them
+        def persist_elements() -> List[int]:
+            page_id, _ = page.result()
+            element_ids = add_elements(db_client=config.db_client, page_id=page_id, elements=elems)
+            if parsed_pages is not None:
+                parsed_pages[page_id] = ParsedPage(
+                    page_id=page_id,
+                    element_ids=dict(zip(get_subtree_keys(elems), element_ids)),
+                    num_elements=len(elems),
+                )
+            return element_ids
+        element_ids = PIPELINE_EXECUTOR.submit(timings.timed("add_elements", persist_elements))
 
         # TODO add same-class grouping
         # query LLM for element group decriptions TODO remove group_positions
@@ -95,35 +221,185 @@ def get_potential_actions(
         #     *get_context_for_page_id(db_client=config.db_client, page_id=page_id)
         # )
 
-        page_ctx, xpaths = zip(
-            *[(e.context, e.xpath) for e in elems]
-        )
-
-        # query LLM to filter parsed content
-        logger.info("Filtering parsed content...")
-        with timer() as t:
-            filtered_elements = filter_context(ctx=page_ctx, website=config.llm_site_id, task_description=config.task_description)
-            filtered_action_descriptions = [desc for _, desc in filtered_elements]
-            filtered_xpaths = [xpaths[int(ann)] for ann, _ in filtered_elements]
-            filtered_element_ids = [element_ids[int(ann)] for ann, _ in filtered_elements]
-            filtered_elems = [elems[int(ann)] for ann, _ in filtered_elements]
-        logger.info(f"Done filtering parsed content. ({t.seconds()}s)")
+        try:
+            with timings.stage("filter"):
+                yield from stream_ranked_filtered_elements(config=config, task_id=task_id, element_ids=element_ids, elements=elems)
+        finally:
+            # wait for the inserts even if nothing was filtered or the caller stopped early, so their errors are
+            # raised and `parsed_pages` is up to date before the next step
+            try:
+                element_ids.result()
+            finally:
+                logger.info(f"Agent step stages: {timings.summary()}")
 
-        # add filtered context to db
-        add_filtered_elements(db_client=config.db_client, task_id=task_id, filtered_element_ids=filtered_element_ids, filtered_descriptions=filtered_action_descriptions)
+    elif parsed_pages is not None and page_id in parsed_pages:
+        logger.info("Page changed since it was last parsed, re-parsing incrementally.")
+        yield from stream_changed_potential_actions(
+            config=config,
+            page_source=page_source,
+            task_id=task_id,
+            parsed_page=parsed_pages[page_id],
+        )
 
     else:
         logger.info("Retrieved page from cache.")
 
         # retrieve filtered elements and xpaths from cache
-        filtered_elements = get_filtered_elements(
+        for element_id, outer_html, xpath in get_filtered_elements(
             db_client=config.db_client,
             task_id=task_id,
             page_id=page_id,
+        ):
+            yield element_id, element_from_outer_html(outer_html, xpath), xpath
+
+
+"""Diff a re-parse of a page against its last parse by subtree hash. Only changed elements are added to the db
+and filtered by the LLM, while unchanged elements keep their ids and previous filtering result"""
+def stream_changed_potential_actions(
+    config: BrowingSessionConfig,
+    page_source: str,
+    task_id: int,
+    parsed_page: ParsedPage,
+) -> Iterator[Tuple[int, DecoratedSoup, str]]:
+    elems = parse_page_source(page_source, parser=config.parser, max_nodes=config.max_nodes, compact=True)
+    keys = get_subtree_keys(elems)
+    element_ids = [parsed_page.element_ids.get(key) for key in keys]
+    changed = [i for i, element_id in enumerate(element_ids) if element_id is None]
+    logger.info(f"{len(changed)} of {len(elems)} elements changed since the last parse")
+
+    # add changed elements to db after those of previous parses
+    changed_ids = add_elements(
+        db_client=config.db_client,
+        page_id=parsed_page.page_id,
+        elements=[elems[i] for i in changed],
+        position_offset=parsed_page.num_elements,
+    )
+    for i, element_id in zip(changed, changed_ids):
+        element_ids[i] = element_id
+    parsed_page.element_ids = dict(zip(keys, element_ids))
+    parsed_page.num_elements += len(changed)
+
+    # unchanged elements the LLM kept before are still kept
+    filtered_ids = {
+        element_id
+        for element_id, _, _ in get_filtered_elements(db_client=config.db_client, task_id=task_id, page_id=parsed_page.page_id)
+    }
+    changed_ids = set(changed_ids)
+    for element_id, e in zip(element_ids, elems):
+        if element_id in filtered_ids and element_id not in changed_ids:
+            yield element_id, e, e.xpath
+
+    if changed:
+        yield from stream_ranked_filtered_elements(
+            config=config,
+            task_id=task_id,
+            element_ids=[element_ids[i] for i in changed],
+            elements=[elems[i] for i in changed],
         )
-        filtered_element_ids, filtered_xpaths = zip(*filtered_elements) if filtered_elements else ([], [])
 
-    return filtered_element_ids, filtered_elements, filtered_xpaths
+
+"""Pre-rank elements by relevance to the task before streaming the LLM's filtering of them. With
+`reuse_filtered_content`, elements identical to ones filtered for the same task on earlier pages keep that result"""
+def stream_ranked_filtered_elements(
+    config: BrowingSessionConfig,
+    task_id: int,
+    element_ids: Union[List[int], Future],
+    elements: List[DecoratedSoup],
+) -> Iterator[Tuple[int, DecoratedSoup, str]]:
+    if config.reuse_filtered_content:
+        element_ids = resolve_element_ids(element_ids)
+        content_hashes = [get_element_content(e)["content_hash"] for e in elements]
+        filtered_contents = get_filtered_contents(db_client=config.db_client, task_id=task_id, content_hashes=content_hashes)
+        kept = [
+            (element_id, e, filtered_contents[content_hash][1])
+            for element_id, e, content_hash in zip(element_ids, elements, content_hashes)
+            if filtered_contents.get(content_hash, (False,))[0]
+        ]
+        logger.info(f"Reusing filtering of {len(filtered_contents)} elements seen on earlier pages, {len(kept)} kept")
+        if kept:
+            kept_ids, _, kept_descriptions = zip(*kept)
+            add_filtered_elements(db_client=config.db_client, task_id=task_id, filtered_element_ids=kept_ids, filtered_descriptions=kept_descriptions)
+        for element_id, e, _ in kept:
+            yield element_id, e, e.xpath
+
+        unseen = [i for i, content_hash in enumerate(content_hashes) if content_hash not in filtered_contents]
+        if not unseen:
+            return
+        element_ids = [element_ids[i] for i in unseen]
+        elements = [elements[i] for i in unseen]
+
+    # keep only the elements most relevant to the task
+    candidates = rank_contexts(
+        [e.context for e in elements],
+        query=config.task_description,
+        top_k=config.prerank_top_k,
+        scorer=config.prerank_scorer,
+    )
+    elements = [elements[i] for i in candidates]
+    element_ids = select_element_ids(element_ids, candidates)
+    if not elements:
+        return
+    page_ctx, xpaths = zip(
+        *[(e.context, e.xpath) for e in elements]
+    )
+
+    # query LLM to filter parsed content
+    logger.info("Filtering parsed content...")
+    yield from stream_filtered_elements(
+        config=config,
+        task_id=task_id,
+        element_ids=element_ids,
+        page_ctx=page_ctx,
+        xpaths=xpaths,
+        elements=elements,
+    )
+
+
+"""Yield (element id, element, xpath) for each element kept by the LLM as its response streams in.
+Elements are None when `elements` is not given. Elements whose prompt was answered in full are recorded as evaluated,
+kept or not, so their filtering can be reused"""
+def stream_filtered_elements(
+    config: BrowingSessionConfig,
+    task_id: int,
+    element_ids: Union[List[int], Future],
+    page_ctx: List[str],
+    xpaths: List[str],
+    elements: List[DecoratedSoup] = None,
+) -> Iterator[Tuple[int, DecoratedSoup, str]]:
+    evaluated = []
+    filtered_elements = stream_filter_context(
+        ctx=page_ctx,
+        website=config.llm_site_id,
+        task_description=config.task_description,
+        max_tokens=config.llm_max_prompt_tokens,
+        max_concurrency=config.llm_max_concurrency,
+        evaluated=evaluated,
+    )
+    filtered_element_ids = []
+    filtered_action_descriptions = []
+    try:
+        with timer() as t:
+            try:
+                for ann, desc in filtered_elements:
+                    # ids are only waited on once the LLM has responded
+                    element_ids = resolve_element_ids(element_ids)
+                    filtered_element_ids += [element_ids[ann]]
+                    filtered_action_descriptions += [desc]
+                    yield element_ids[ann], elements[ann] if elements is not None else None, xpaths[ann]
+            finally:
+                # finish reading the response so the complete filtering result is cached
+                for ann, desc in filtered_elements:
+                    element_ids = resolve_element_ids(element_ids)
+                    filtered_element_ids += [element_ids[ann]]
+                    filtered_action_descriptions += [desc]
+    finally:
+        logger.info(f"Done filtering parsed content. ({t.seconds()}s)")
+
+        # add filtered context to db
+        add_filtered_elements(db_client=config.db_client, task_id=task_id, filtered_element_ids=filtered_element_ids, filtered_descriptions=filtered_action_descriptions)
+        if evaluated:
+            element_ids = resolve_element_ids(element_ids)
+            add_evaluated_elements(db_client=config.db_client, task_id=task_id, element_ids=[element_ids[i] for i in evaluated])
 
 
 def get_action_metadata(
@@ -131,9 +407,17 @@ def get_action_metadata(
     element_ids: List[int],
     elements: List[DecoratedSoup],
     xpaths: List[str]
+) -> Tuple[int, str, ActionSpec]:
+    return get_first_action_metadata(config=config, filtered=zip(element_ids, elements, xpaths))
+
+
+"""`filtered` yields (element id, element, xpath) and may be a stream such as stream_potential_actions"""
+def get_first_action_metadata(
+    config: BrowingSessionConfig,
+    filtered: Iterable[Tuple[int, DecoratedSoup, str]],
 ) -> Tuple[int, str, ActionSpec]:
     # try to execute for action for filtered xpaths
-    for element_id, element, xpath in zip(element_ids, elements, xpaths):
+    for element_id, element, xpath in filtered:
         # TODO parse to find nearest interactive element (or re-prompt)
         if not is_interactive_element(element):
             logger.warning(f"Element is not interactive: {element.tag_name}")
@@ -1,13 +1,14 @@
 import os
 import os.path
-import time
 import undetected_chromedriver as uc
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 
+from .readiness import wait_for_quiet_page, DEFAULT_QUIET_WINDOW, DEFAULT_READY_TIMEOUT
+
 EXTENSION_DIR = "chrome-extension"
 
 
-def start_driver(extension_name: str = None) -> uc.Chrome:
+def start_driver(extension_name: str = None, headless: bool = False) -> uc.Chrome:
     chrome_options = uc.ChromeOptions()
     dc = DesiredCapabilities().CHROME
     dc["pageLoadStrategy"] = "none"
@@ -20,6 +21,7 @@ def start_driver(extension_name: str = None) -> uc.Chrome:
         driver_executable_path=os.getenv("CHROMEDRIVER_PATH"),
         browser_executable_path=os.getenv("CHROME_PATH"),
         desired_capabilities=dc,
+        headless=headless,
     )
 
 
@@ -27,9 +29,9 @@ def is_ready(driver: uc.Chrome) -> bool:
     return driver.execute_script('return document.readyState') == 'complete'
 
 
-def wait_until_ready(driver: uc.Chrome, t: float = 0.2):
-    while not is_ready(driver):
-        time.sleep(t)
+"""Wait for the page to load and then stay quiet (no DOM changes or network activity) for `quiet_window` seconds"""
+def wait_until_ready(driver: uc.Chrome, quiet_window: float = DEFAULT_QUIET_WINDOW, timeout: float = DEFAULT_READY_TIMEOUT) -> bool:
+    return wait_for_quiet_page(driver, quiet_window=quiet_window, timeout=timeout)
 
 
 def get_annotator(driver: uc.Chrome) -> "PageAnnotator":
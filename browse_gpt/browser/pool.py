@@ -0,0 +1,194 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from queue import Queue, Empty
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Set
+from urllib.parse import urlparse
+import undetected_chromedriver as uc
+
+from .chromedriver import start_driver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_TIMEOUT = 300.  # seconds
+MAX_START_ATTEMPTS = 3
+
+
+class PooledDriver:
+    __slots__ = ("driver", "num_leases", "started_at")
+
+    def __init__(self, driver: uc.Chrome):
+        self.driver = driver
+        self.num_leases = 0
+        self.started_at = time.monotonic()
+
+
+"""Fixed-size pool of pre-started Chrome instances leased to browsing sessions one at a time.
+Drivers are reset between leases (extra tabs closed, storage and cookies cleared) and replaced when they
+stop responding, raise during a lease, or reach `max_leases`, which bounds memory leaked by long-lived browsers.
+A slot whose replacement driver fails to start is dropped, lowering the pool's size"""
+class DriverPool:
+    def __init__(
+        self,
+        size: int,
+        headless: bool = True,
+        extension_name: str = None,
+        max_leases: int = None,
+        driver_factory: Callable[[], uc.Chrome] = None,
+    ):
+        if size < 1:
+            raise Exception("Driver pool needs at least one driver")
+        self.size = size
+        self.max_leases = max_leases
+        self.driver_factory = driver_factory or (lambda: start_driver(extension_name=extension_name, headless=headless))
+        self.available: "Queue[PooledDriver]" = Queue()
+        self.lock = Lock()
+        self.closed = False
+
+        # metrics
+        self.created_at = time.monotonic()
+        self.num_leases = 0
+        self.num_recycled = 0
+        self.num_leased = 0
+        self.num_start_failures = 0
+        self.queue_waits: List[float] = []
+        self.busy_seconds = 0.
+
+        logger.info(f"Starting {size} browser drivers...")
+        with ThreadPoolExecutor(max_workers=size) as executor:
+            for driver in executor.map(lambda _: self.driver_factory(), range(size)):
+                self.available.put(PooledDriver(driver))
+        logger.info(f"Started {size} browser drivers. ({time.monotonic() - self.created_at:.2f}s)")
+
+    """Lease a driver for the duration of the context, waiting up to `timeout` seconds for one to be released"""
+    @contextmanager
+    def lease(self, timeout: float = DEFAULT_LEASE_TIMEOUT) -> Iterator[uc.Chrome]:
+        if self.closed:
+            raise Exception("Driver pool is closed")
+        wait_start = time.monotonic()
+        try:
+            pooled = self.available.get(timeout=timeout)
+        except Empty:
+            raise Exception(f"No browser driver was released within {timeout}s")
+        if pooled is None:
+            # every slot was dropped, pass the sentinel on to other waiting leases
+            self.available.put(None)
+            raise Exception("Driver pool has no drivers left")
+        lease_start = time.monotonic()
+        with self.lock:
+            self.queue_waits += [lease_start - wait_start]
+            self.num_leases += 1
+            self.num_leased += 1
+        pooled.num_leases += 1
+
+        healthy = False
+        try:
+            yield pooled.driver
+            healthy = True
+        finally:
+            with self.lock:
+                self.busy_seconds += time.monotonic() - lease_start
+                self.num_leased -= 1
+            self.release(pooled, healthy=healthy)
+
+    def release(self, pooled: PooledDriver, healthy: bool = True):
+        if self.closed:
+            quit_driver(pooled.driver)
+            return
+        expired = self.max_leases is not None and pooled.num_leases >= self.max_leases
+        if healthy and not expired:
+            try:
+                reset_driver(pooled.driver)
+                self.available.put(pooled)
+                return
+            except Exception as e:
+                logger.warning(f"Failed to reset browser driver: {e}")
+        logger.info(f"Recycling browser driver after {pooled.num_leases} leases")
+        quit_driver(pooled.driver)
+        with self.lock:
+            self.num_recycled += 1
+        self.replace_driver()
+
+    """Start a driver for a freed slot, dropping the slot if it fails to start `MAX_START_ATTEMPTS` times"""
+    def replace_driver(self):
+        for attempt in range(MAX_START_ATTEMPTS):
+            try:
+                self.available.put(PooledDriver(self.driver_factory()))
+                return
+            except Exception as e:
+                with self.lock:
+                    self.num_start_failures += 1
+                logger.warning(f"Failed to start browser driver (attempt {attempt + 1}/{MAX_START_ATTEMPTS}): {e}")
+        with self.lock:
+            self.size -= 1
+            size = self.size
+        logger.error(f"Dropped a driver slot, the pool has {size} drivers left")
+        if size == 0:
+            self.available.put(None)
+
+    """Queue wait and utilization since the pool started. Utilization is the fraction of driver time spent leased"""
+    def metrics(self) -> Dict[str, float]:
+        with self.lock:
+            elapsed = time.monotonic() - self.created_at
+            waits = sorted(self.queue_waits)
+            return {
+                "leases": self.num_leases,
+                "leased": self.num_leased,
+                "recycled": self.num_recycled,
+                "start_failures": self.num_start_failures,
+                "size": self.size,
+                "mean_queue_wait": sum(waits) / len(waits) if waits else 0.,
+                "max_queue_wait": waits[-1] if waits else 0.,
+                "utilization": self.busy_seconds / (elapsed * self.size) if elapsed * self.size > 0 else 0.,
+            }
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                pooled = self.available.get_nowait()
+            except Empty:
+                break
+            if pooled is not None:
+                quit_driver(pooled.driver)
+        logger.info(f"Closed driver pool. {self.metrics()}")
+
+
+"""Return a driver to a blank state: one tab on about:blank with no history or cookies, and no storage for any
+origin loaded in a tab during the lease. Origins only loaded in frames keep their storage"""
+def reset_driver(driver: uc.Chrome):
+    main_handle, *extra_handles = driver.window_handles
+    origins = set()
+    for handle in extra_handles:
+        driver.switch_to.window(handle)
+        origins |= get_history_origins(driver)
+        driver.close()
+    driver.switch_to.window(main_handle)
+    origins |= get_history_origins(driver)
+
+    # cookies are cleared for every site, storage per origin
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    for origin in origins:
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+    driver.get("about:blank")
+    driver.execute_cdp_cmd("Page.resetNavigationHistory", {})
+
+
+"""Origins of the pages in the current tab's history"""
+def get_history_origins(driver: uc.Chrome) -> Set[str]:
+    history = driver.execute_cdp_cmd("Page.getNavigationHistory", {})
+    origins = set()
+    for entry in history["entries"]:
+        url = urlparse(entry["url"])
+        if url.scheme in ["http", "https"]:
+            origins.add(f"{url.scheme}://{url.netloc}")
+    return origins
+
+
+def quit_driver(driver: uc.Chrome):
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning(f"Failed to quit browser driver: {e}")
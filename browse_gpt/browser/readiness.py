@@ -0,0 +1,98 @@
+import logging
+import time
+from typing import Dict
+import undetected_chromedriver as uc
+from selenium.common.exceptions import JavascriptException, TimeoutException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUIET_WINDOW = 0.5  # seconds
+DEFAULT_READY_TIMEOUT = 10.  # seconds
+SCRIPT_TIMEOUT_MARGIN = 5.  # seconds
+RETRY_DELAY = 0.05  # seconds
+
+# Resolves once the document has loaded, no fetch/XHR requests are in flight and neither the DOM (MutationObserver)
+# nor resource loading (PerformanceObserver) has changed for `quietMs`, or once `timeoutMs` has passed.
+# fetch and XMLHttpRequest are wrapped once per document to count requests in flight, so requests started before
+# the first wait on a document are only seen through resource timing as they finish.
+# Returns {ready, waited (seconds), mutations, pending (requests in flight)}
+PAGE_READY_SCRIPT = """
+const [quietMs, timeoutMs, done] = arguments;
+const start = performance.now();
+if (!window.__browseGptNetwork) {
+    const network = {pending: 0};
+    const fetch = window.fetch;
+    if (fetch) {
+        window.fetch = function (...args) {
+            network.pending++;
+            return fetch.apply(this, args).finally(() => { network.pending--; });
+        };
+    }
+    const send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function (...args) {
+        network.pending++;
+        this.addEventListener("loadend", () => { network.pending--; }, {once: true});
+        return send.apply(this, args);
+    };
+    window.__browseGptNetwork = network;
+}
+const network = window.__browseGptNetwork;
+
+let lastActivity = start;
+let mutations = 0;
+const mutationObserver = new MutationObserver((records) => {
+    mutations += records.length;
+    lastActivity = performance.now();
+});
+mutationObserver.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+let resourceObserver = null;
+try {
+    resourceObserver = new PerformanceObserver(() => { lastActivity = performance.now(); });
+    resourceObserver.observe({type: "resource"});
+} catch (e) {}
+
+const check = () => {
+    const now = performance.now();
+    const quiet = document.readyState === "complete" && network.pending <= 0 && now - lastActivity >= quietMs;
+    if (quiet || now - start >= timeoutMs) {
+        mutationObserver.disconnect();
+        if (resourceObserver) {
+            resourceObserver.disconnect();
+        }
+        done({ready: quiet, waited: (now - start) / 1000, mutations: mutations, pending: network.pending});
+        return;
+    }
+    // wake up when the quiet window would end if nothing else happens
+    setTimeout(check, Math.max(quietMs - (now - lastActivity), 16));
+};
+check();
+"""
+
+
+"""Block until the page has been quiet for `quiet_window` seconds, with one script call per document.
+Navigating away mid-wait unloads the script, in which case the wait restarts on the new document. Other driver
+errors, e.g. from a closed window or session, are raised.
+Returns whether the page became quiet before `timeout`"""
+def wait_for_quiet_page(driver: uc.Chrome, quiet_window: float = DEFAULT_QUIET_WINDOW, timeout: float = DEFAULT_READY_TIMEOUT) -> bool:
+    previous_script_timeout = driver.timeouts.script
+    driver.set_script_timeout(timeout + SCRIPT_TIMEOUT_MARGIN)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = max(deadline - time.monotonic(), 0.)
+            try:
+                result: Dict = driver.execute_async_script(PAGE_READY_SCRIPT, quiet_window * 1000, remaining * 1000)
+            # the script is unloaded with its document (javascript error) or outlives the script timeout
+            except (JavascriptException, TimeoutException) as e:
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Page did not become ready within {timeout}s: {e.msg}")
+                    return False
+                logger.debug(f"Page changed while waiting for it to become ready, waiting again: {e.msg}")
+                time.sleep(RETRY_DELAY)
+                continue
+            if not result["ready"]:
+                logger.warning(f"Page did not become quiet within {timeout}s ({result['pending']} requests in flight)")
+            logger.debug(f"Page ready after {result['waited']:.3f}s ({result['mutations']} DOM mutations)")
+            return result["ready"]
+    finally:
+        driver.set_script_timeout(previous_script_timeout)
@@ -0,0 +1,61 @@
+from typing import Dict, List
+import undetected_chromedriver as uc
+from undetected_chromedriver.webelement import WebElement
+
+# For each xpath returns the first interactive element at or under the element it selects, as
+# [element, tag name, {attribute: value}], or null when the xpath or an interactive element is not found.
+# `interactive` is a CSS selector, so the match follows processing.extract_first_interactive_from_outer_html
+RESOLVE_INTERACTIVE_SCRIPT = """
+const [xpaths, interactive, attrNames] = arguments;
+return xpaths.map((xpath) => {
+    let el = null;
+    try {
+        el = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    } catch (e) {}
+    if (el === null || el.nodeType !== Node.ELEMENT_NODE) {
+        return null;
+    }
+    const target = el.matches(interactive) ? el : el.querySelector(interactive);
+    if (target === null) {
+        return null;
+    }
+    const attrs = {};
+    for (const a of attrNames) {
+        const value = target.getAttribute(a);
+        if (value !== null) {
+            attrs[a] = value;
+        }
+    }
+    return [target, target.localName.toLowerCase(), attrs];
+});
+"""
+
+
+"""Interactive element found for a filtered xpath. Attributes read along with it are answered without querying
+the driver, so is_interactive_element and is_text_input can be applied directly"""
+class ResolvedElement:
+    __slots__ = ("xpath", "element", "tag_name", "attrs")
+
+    def __init__(self, xpath: str, element: WebElement, tag_name: str, attrs: Dict[str, str], attr_names: List[str]):
+        self.xpath = xpath
+        self.element = element
+        self.tag_name = tag_name
+        # attributes that were read but are not set are None rather than missing
+        self.attrs = {a: attrs.get(a) for a in attr_names}
+
+    def get_attribute(self, name: str) -> str:
+        if name in self.attrs:
+            return self.attrs[name]
+        return self.element.get_attribute(name)
+
+
+"""Resolve the first interactive element for each xpath with one script call. Returns None for xpaths with no
+element or no interactive element"""
+def resolve_interactive_elements(driver: uc.Chrome, xpaths: List[str], selector: str, attr_names: List[str]) -> List[ResolvedElement]:
+    if not xpaths:
+        return []
+    results = driver.execute_script(RESOLVE_INTERACTIVE_SCRIPT, list(xpaths), selector, attr_names)
+    return [
+        ResolvedElement(xpath=xpath, element=r[0], tag_name=r[1], attrs=r[2], attr_names=attr_names) if r is not None else None
+        for xpath, r in zip(xpaths, results)
+    ]
@@ -0,0 +1,128 @@
+from dataclasses import dataclass
+import json
+from typing import Dict, List, Tuple
+import undetected_chromedriver as uc
+
+SNAPSHOT_ATTRIBUTES = ["aria-label", "placeholder", "role", "href", "type"]
+
+# Walks the live DOM once and returns the serialized document along with one record per element:
+# [xpath, tag name, visible, x, y, width, height, class, {attribute: value}]
+# XPaths follow processing.get_driver_elem: `/html` for the root, `name[i]` for HTML elements and
+# `*[name()="name"][i]` for foreign (e.g. SVG) elements, indexed among same-name siblings.
+# Visibility approximates WebElement.is_displayed: hidden by display/visibility/opacity (display and
+# opacity apply to descendants), and shown only if the element or one of its descendants has a nonzero size.
+DOM_SNAPSHOT_SCRIPT = """
+const attrNames = arguments[0];
+const XHTML_NS = "http://www.w3.org/1999/xhtml";
+const root = document.documentElement;
+const records = [];
+const parents = [];
+const hidden = [];
+const sized = [];
+const stack = [[root, "/" + root.localName.toLowerCase(), -1, false]];
+while (stack.length > 0) {
+    const [el, xpath, parentIdx, ancestorHidden] = stack.pop();
+    const idx = records.length;
+    const style = window.getComputedStyle(el);
+    const rect = el.getBoundingClientRect();
+    const name = el.localName.toLowerCase();
+    const collapsed = ancestorHidden || style.display === "none" || parseFloat(style.opacity) === 0;
+    hidden.push(
+        collapsed
+        || style.visibility === "hidden"
+        || style.visibility === "collapse"
+        || (name === "input" && (el.getAttribute("type") || "").toLowerCase() === "hidden")
+    );
+    sized.push(rect.width > 0 && rect.height > 0);
+    parents.push(parentIdx);
+
+    const attrs = {};
+    for (const a of attrNames) {
+        const value = el.getAttribute(a);
+        if (value !== null) {
+            attrs[a] = value;
+        }
+    }
+    records.push([
+        xpath,
+        name,
+        0,
+        Math.round(rect.x),
+        Math.round(rect.y),
+        Math.round(rect.width),
+        Math.round(rect.height),
+        el.getAttribute("class") || "",
+        attrs,
+    ]);
+
+    const tagIdxs = {};
+    const children = [];
+    for (const c of el.children) {
+        const cName = c.localName.toLowerCase();
+        tagIdxs[cName] = (tagIdxs[cName] || 0) + 1;
+        const step = c.namespaceURI === XHTML_NS
+            ? `${cName}[${tagIdxs[cName]}]`
+            : `*[name()="${cName}"][${tagIdxs[cName]}]`;
+        children.push([c, `${xpath}/${step}`, idx, collapsed]);
+    }
+    for (let i = children.length - 1; i >= 0; i--) {
+        stack.push(children[i]);
+    }
+}
+// children come after their parent in document order, so one reverse pass propagates size upward
+for (let i = records.length - 1; i >= 0; i--) {
+    if (sized[i] && !hidden[i] && parents[i] >= 0) {
+        sized[parents[i]] = true;
+    }
+}
+for (let i = 0; i < records.length; i++) {
+    records[i][2] = sized[i] && !hidden[i] ? 1 : 0;
+}
+return JSON.stringify({html: root.outerHTML, nodes: records});
+"""
+
+
+def take_dom_snapshot(driver: uc.Chrome, attrs: List[str] = SNAPSHOT_ATTRIBUTES) -> "DOMSnapshot":
+    return DOMSnapshot.from_json(driver.execute_script(DOM_SNAPSHOT_SCRIPT, attrs))
+
+
+@dataclass
+class NodeSnapshot:
+    xpath: str
+    tag_name: str
+    visible: bool
+    rect: Tuple[int, int, int, int]
+    classes: List[str]
+    attrs: Dict[str, str]
+
+    @staticmethod
+    def from_record(record: list) -> "NodeSnapshot":
+        xpath, tag_name, visible, x, y, width, height, classes, attrs = record
+        return NodeSnapshot(
+            xpath=xpath,
+            tag_name=tag_name,
+            visible=bool(visible),
+            rect=(x, y, width, height),
+            classes=classes.split(),
+            attrs=attrs,
+        )
+
+
+class DOMSnapshot:
+    def __init__(self, html: str, nodes: List[NodeSnapshot]):
+        self.html = html
+        self.nodes = {n.xpath: n for n in nodes}
+
+    @staticmethod
+    def from_json(payload: str) -> "DOMSnapshot":
+        obj = json.loads(payload)
+        return DOMSnapshot(
+            html=obj["html"],
+            nodes=[NodeSnapshot.from_record(r) for r in obj["nodes"]],
+        )
+
+    def get(self, xpath: str) -> NodeSnapshot:
+        return self.nodes.get(xpath)
+
+    def __len__(self):
+        return len(self.nodes)
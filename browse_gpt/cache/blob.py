@@ -0,0 +1,78 @@
+import gzip
+import io
+import os
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from typing import TextIO
+
+from ..config import BlobCompression
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BLOB_SUBDIR = "blobs"
+BLOB_ENCODING = "utf-8"
+BLOB_EXTENSIONS = {BlobCompression.GZIP: ".gz", BlobCompression.ZSTD: ".zst"}
+
+
+def hash_content(content: bytes) -> str:
+    return sha256(content).hexdigest()
+
+
+def get_blob_path(content_hash: str, cache_dir: str, extension: str = ".html", compression: BlobCompression = BlobCompression.GZIP) -> str:
+    # shard by hash prefix to keep directories small
+    return os.path.join(cache_dir, BLOB_SUBDIR, content_hash[:2], content_hash + extension + BLOB_EXTENSIONS[compression])
+
+
+def compress(content: bytes, compression: BlobCompression) -> bytes:
+    if compression == BlobCompression.ZSTD:
+        if zstandard is None:
+            raise Exception("zstd compression requires the `zstandard` package")
+        return zstandard.ZstdCompressor().compress(content)
+    # fix mtime so identical content produces identical blobs
+    return gzip.compress(content, mtime=0)
+
+
+"""Write content to a temporary file beside `path` and rename it into place, so readers never see a partial file"""
+def write_atomic(content: bytes, path: str) -> str:
+    dir = os.path.dirname(path)
+    os.makedirs(dir, exist_ok=True)
+    with NamedTemporaryFile(dir=dir, prefix=".tmp-", delete=False) as f:
+        try:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
+    return path
+
+
+"""Store content under the hash of its text, compressed. Content already in the store is not rewritten.
+Returns the blob path"""
+def save_blob(content: str, cache_dir: str, extension: str = ".html", compression: BlobCompression = BlobCompression.GZIP) -> str:
+    content = content.encode(BLOB_ENCODING)
+    path = get_blob_path(hash_content(content), cache_dir=cache_dir, extension=extension, compression=compression)
+    if not os.path.exists(path):
+        write_atomic(compress(content, compression), path)
+    return path
+
+
+"""Open a blob for streaming text reads, decompressing as it is read. Paths without a compression
+extension are opened as plain text"""
+def open_blob(path: str) -> TextIO:
+    if path.endswith(BLOB_EXTENSIONS[BlobCompression.GZIP]):
+        return gzip.open(path, "rt", encoding=BLOB_ENCODING)
+    if path.endswith(BLOB_EXTENSIONS[BlobCompression.ZSTD]):
+        if zstandard is None:
+            raise Exception("zstd decompression requires the `zstandard` package")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True), encoding=BLOB_ENCODING)
+    return open(path, "r")
+
+
+def load_blob(path: str) -> str:
+    with open_blob(path) as f:
+        return f.read()
@@ -1,59 +1,141 @@
-from typing import List, Tuple
-from sqlalchemy import text
+from typing import Dict, List, Tuple
+from sqlalchemy import insert, select, text, bindparam
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from ..processing import DecoratedSoup, DecoratedSoupGroup, format_text_newline
-from ..model import Element, FilteredElement
+from ..model import Element, ElementContent, EvaluatedElement, FilteredElement
 from ..db import DBClient
+from ..util import hash_text
 
 
-# page_id | is_root | is_leaf | parent_id | xpath | element_position | outer_html | context | description
-def add_elements(db_client: DBClient, page_id: int, elements: List[DecoratedSoup]) -> List[int]:
-    element_ids = []
+"""Key for an element's shared content. Elements parsed with index_contents are keyed by their subtree hash,
+others (e.g. same-class groups) by a hash of their outer HTML"""
+def get_content_hash(outer_html: str, context: str, subtree_hash: str = None) -> str:
+    if subtree_hash is None:
+        subtree_hash = hash_text(outer_html)
+    return hash_text(f"{subtree_hash}\n{context}")
+
+
+def get_element_content(e: DecoratedSoup) -> dict:
+    context = format_text_newline(e.context)
+    return dict(
+        content_hash=get_content_hash(e.outer_html, context, subtree_hash=e.subtree_hash),
+        outer_html=e.outer_html,
+        context=context,
+    )
+
+
+# content_hash | outer_html | context
+"""Get ids of element contents, inserting those not stored yet. Returns a mapping from content hash to id"""
+def add_element_contents(db_session: Session, contents: List[dict]) -> Dict[str, int]:
+    contents = {c["content_hash"]: c for c in contents}
+    select_ids = lambda hashes: db_session.execute(
+        select(ElementContent.content_hash, ElementContent.id).where(ElementContent.content_hash.in_(hashes))
+    ).all()
+    id_for_hash = dict(select_ids(list(contents)))
+    missing = [c for content_hash, c in contents.items() if content_hash not in id_for_hash]
+    if missing:
+        dialect_insert = sqlite_insert if db_session.bind.dialect.name == "sqlite" else pg_insert
+        id_for_hash.update(db_session.execute(
+            dialect_insert(ElementContent).values(missing)
+            .on_conflict_do_nothing(index_elements=[ElementContent.content_hash])
+            .returning(ElementContent.content_hash, ElementContent.id)
+        ).all())
+        # contents inserted concurrently by another session are not returned
+        conflicts = [c["content_hash"] for c in missing if c["content_hash"] not in id_for_hash]
+        if conflicts:
+            id_for_hash.update(select_ids(conflicts))
+    return id_for_hash
+
+
+# rows for a page's root elements, as (element, content), and for children of same-class groups, as
+# (parent position, element, content), without page ids. Plain dicts, so they can be built in another process
+ElementRows = Tuple[List[Tuple[dict, dict]], List[Tuple[int, dict, dict]]]
+
+
+"""Rows to insert for a page's elements. Root positions start at `position_offset`"""
+def get_element_rows(elements: List[DecoratedSoup], position_offset: int = 0) -> ElementRows:
+    roots = []
+    children = []
+    for i, e in enumerate(elements, start=position_offset):
+        if isinstance(e, DecoratedSoupGroup):
+            context = format_text_newline("\n".join([e_.context for e_ in e.elems]))
+            outer_html = str(e.soup.parent)  # TODO Change: currently DecoratedSoupGroup sets soup to first element
+            roots += [(dict(
+                parent_id=None,
+                xpath=e.group_xpath,
+                element_position=i,
+                is_root=True,
+                is_leaf=False,
+            ), dict(content_hash=get_content_hash(outer_html, context), outer_html=outer_html, context=context))]
+            children += [
+                (i, dict(
+                    xpath=e_.xpath,
+                    element_position=j,
+                    is_root=False,
+                    is_leaf=True,
+                ), get_element_content(e_))
+                for j, e_ in enumerate(e.elems)
+            ]
+        else:
+            roots += [(dict(
+                parent_id=None,
+                xpath=e.xpath,
+                element_position=i,
+                is_root=True,
+                is_leaf=True,
+            ), get_element_content(e))]
+    return roots, children
+
+
+# page_id | is_root | is_leaf | parent_id | xpath | element_position | content_id | description
+"""Insert a page's elements with one statement for root elements and one for the children of same-class groups.
+Outer HTML and context are stored once per distinct content and shared between elements.
+Root positions start at `position_offset`, so elements can be added to a page that already has some.
+Returns ids of the root elements in the order given"""
+def add_elements(db_client: DBClient, page_id: int, elements: List[DecoratedSoup], position_offset: int = 0) -> List[int]:
+    return add_element_rows(db_client=db_client, page_rows=[(page_id, get_element_rows(elements, position_offset=position_offset))])[0]
+
+
+"""Insert elements for several pages in one transaction, with one statement for all root elements and one for all
+children of same-class groups. Returns ids of each page's root elements in the order given"""
+def add_element_rows(db_client: DBClient, page_rows: List[Tuple[int, ElementRows]]) -> List[List[int]]:
+    roots = [(page_id, root, c) for page_id, (page_roots, _) in page_rows for root, c in page_roots]
+    children = [(page_id, i, child, c) for page_id, (_, page_children) in page_rows for i, child, c in page_children]
+    if not roots:
+        return [[] for _ in page_rows]
+
     with db_client.transaction() as db_session:
-        for i, e in enumerate(elements):
-            if isinstance(e, DecoratedSoupGroup):
-                context = "\n".join([e_.context for e_ in e.elems])
-                parent_element = Element(
-                    page_id=page_id,
-                    xpath=e.group_xpath,
-                    element_position=i,
-                    outer_html=str(e.soup.parent),  # TODO Change: currently DecoratedSoupGroup sets soup to first element
-                    is_leaf=False,
-                    context=format_text_newline(context),
-                )
-                db_session.add(parent_element)
-                db_session.commit()
-
-                for j, e_ in enumerate(e.elems):
-                    element = Element(
-                        page_id=page_id,
-                        parent_id=parent_element.id,
-                        xpath=e_.xpath,
-                        element_position=j,
-                        outer_html=str(e_.soup),
-                        is_root=False,
-                        context=format_text_newline(e_.context),
-                    )
-                    db_session.add(element)
-                
-                element_ids += [parent_element.id]
-            else:
-                element = Element(
-                    page_id=page_id,
-                    element_position=i,
-                    xpath=e.xpath,
-                    outer_html=str(e.soup),
-                    context=format_text_newline(e.context),
-                )
-                db_session.add(element)
-                db_session.commit()
+        content_ids = add_element_contents(db_session, [c for _, _, c in roots] + [c for _, _, _, c in children])
 
-                element_ids += [element.id]
+        # rows returned from a multi-row insert are not guaranteed to be in parameter order, so match on position
+        id_for_position = {
+            (page_id, position): element_id
+            for page_id, position, element_id in db_session.execute(
+                insert(Element).returning(Element.page_id, Element.element_position, Element.id),
+                [dict(page_id=page_id, content_id=content_ids[c["content_hash"]], **root) for page_id, root, c in roots],
+            ).all()
+        }
+        if children:
+            db_session.execute(
+                insert(Element),
+                [
+                    dict(page_id=page_id, parent_id=id_for_position[(page_id, i)], content_id=content_ids[c["content_hash"]], **child)
+                    for page_id, i, child, c in children
+                ],
+            )
 
-        return element_ids
+        return [
+            [id_for_position[(page_id, root["element_position"])] for root, _ in page_roots]
+            for page_id, (page_roots, _) in page_rows
+        ]
 
 
 # task_id | element_id
+"""Upsert filtered elements for a task in one statement, replacing the description of elements already filtered.
+Returns filtered element ids in the order given"""
 def add_filtered_elements(
         db_client: DBClient,
         task_id: int,
@@ -62,14 +144,36 @@ def add_filtered_elements(
 ) -> List[int]:
     if filtered_descriptions is None:
         filtered_descriptions = [None] * len(filtered_element_ids)
+    if not filtered_element_ids:
+        return []
+
+    # ON CONFLICT cannot update the same row twice in one statement, so keep the last description per element
+    rows = {
+        element_id: dict(task_id=task_id, element_id=element_id, description=description)
+        for element_id, description in zip(filtered_element_ids, filtered_descriptions)
+    }
     with db_client.transaction() as db_session:
-        for element_id, description in zip(filtered_element_ids, filtered_descriptions):
-            filtered_elem = FilteredElement(
-                task_id=task_id,
-                element_id=element_id,
-                description=description,
-            )
-            db_session.add(filtered_elem)
+        dialect_insert = sqlite_insert if db_session.bind.dialect.name == "sqlite" else pg_insert
+        stmt = dialect_insert(FilteredElement).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FilteredElement.task_id, FilteredElement.element_id],
+            set_={"description": stmt.excluded.description},
+        ).returning(FilteredElement.element_id, FilteredElement.id)
+        id_for_element = dict(db_session.execute(stmt).all())
+        return [id_for_element[element_id] for element_id in filtered_element_ids]
+
+
+# task_id | element_id
+"""Record the elements whose filtering for a task the LLM answered in full, in one statement"""
+def add_evaluated_elements(db_client: DBClient, task_id: int, element_ids: List[int]):
+    if not element_ids:
+        return
+    with db_client.transaction() as db_session:
+        dialect_insert = sqlite_insert if db_session.bind.dialect.name == "sqlite" else pg_insert
+        stmt = dialect_insert(EvaluatedElement).values([
+            dict(task_id=task_id, element_id=element_id) for element_id in dict.fromkeys(element_ids)
+        ]).on_conflict_do_nothing(index_elements=[EvaluatedElement.task_id, EvaluatedElement.element_id])
+        db_session.execute(stmt)
 
 
 def get_filtered_elements(db_client: DBClient, task_id: int, page_id: int) -> List[Tuple[int, str]]:
@@ -78,6 +182,7 @@ def get_filtered_elements(db_client: DBClient, task_id: int, page_id: int) -> Li
             text("""
                 SELECT elements.id, outer_html, xpath
                 FROM elements
+                JOIN element_contents ON element_contents.id = content_id
                 JOIN filtered_elements ON element_id = elements.id
                 WHERE
                     task_id = :task_id
@@ -85,3 +190,55 @@ def get_filtered_elements(db_client: DBClient, task_id: int, page_id: int) -> Li
             """),
             {"task_id": task_id, "page_id": page_id},
         ).fetchall()
+
+
+"""Pages along with the task filtering them and the ids of the elements it kept, one row per (task, page)"""
+def get_filtered_element_ids_by_task(db_client: DBClient) -> List[Tuple[int, int, str, List[int]]]:
+    with db_client.transaction() as db_session:
+        rows = db_session.execute(
+            text("""
+                SELECT tasks.id, elements.page_id, tasks.context, elements.id
+                FROM filtered_elements
+                JOIN elements ON element_id = elements.id
+                JOIN tasks ON task_id = tasks.id
+                ORDER BY tasks.id, elements.page_id
+            """),
+        ).fetchall()
+    filtered = {}
+    for task_id, page_id, task_context, element_id in rows:
+        filtered.setdefault((task_id, page_id, task_context), []).append(element_id)
+    return [(task_id, page_id, task_context, element_ids) for (task_id, page_id, task_context), element_ids in filtered.items()]
+
+
+"""Earlier filtering of identical contents for the same task description. Only elements the LLM evaluated count,
+so contents left out of its prompts, e.g. by pre-ranking, are missing and should be filtered again.
+Returns a mapping from content hash to (whether the LLM kept it, its description)"""
+def get_filtered_contents(db_client: DBClient, task_id: int, content_hashes: List[str]) -> Dict[str, Tuple[bool, str]]:
+    if not content_hashes:
+        return {}
+    with db_client.transaction() as db_session:
+        rows = db_session.execute(
+            text("""
+                WITH related_tasks AS (
+                    SELECT tasks.id
+                    FROM tasks
+                    JOIN tasks current_task ON tasks.context_hash = current_task.context_hash
+                        AND tasks.context = current_task.context
+                    WHERE current_task.id = :task_id
+                )
+                SELECT
+                    content_hash,
+                    MAX(CASE WHEN filtered_elements.id IS NULL THEN 0 ELSE 1 END) AS kept,
+                    MAX(filtered_elements.description) AS description
+                FROM evaluated_elements
+                JOIN elements ON evaluated_elements.element_id = elements.id
+                JOIN element_contents ON element_contents.id = content_id
+                LEFT JOIN filtered_elements ON filtered_elements.element_id = elements.id
+                    AND filtered_elements.task_id IN (SELECT id FROM related_tasks)
+                WHERE evaluated_elements.task_id IN (SELECT id FROM related_tasks)
+                    AND content_hash IN :content_hashes
+                GROUP BY content_hash
+            """).bindparams(bindparam("content_hashes", expanding=True)),
+            {"task_id": task_id, "content_hashes": list(content_hashes)},
+        ).fetchall()
+    return {content_hash: (bool(kept), description) for content_hash, kept, description in rows}
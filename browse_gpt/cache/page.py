@@ -1,8 +1,19 @@
+from typing import List, Set, Tuple
+from sqlalchemy import insert
+
 from ..db import DBClient
 from ..model import Page
 from ..util import hash_url
 from ..config import CommonConfig
-from .util import save_to_cache, PAGE_HTML_FILENAME
+from .blob import save_blob
+
+
+def get_page_id(config: CommonConfig, session_id: int, url: str) -> int:
+    with config.db_client.transaction() as db_session:
+        return db_session.query(Page.id) \
+                    .filter(Page.session_id == session_id) \
+                    .filter(Page.url_hash == hash_url(url)) \
+                    .scalar()
 
 
 # session_id | url | url_hash | content_path
@@ -16,15 +27,57 @@ def new_page(config: CommonConfig, session_id: int, url: str, content: str) -> i
         if session is not None:
             return session.id, True
         
-        # save page content
-        content_path = save_to_cache(
+        # save page content, shared between sessions that see identical content
+        content_path = save_blob(
             content=content,
-            page_id=url_hash,
-            session_id=config.session_id,
             cache_dir=config.cache_dir,
-            filename=PAGE_HTML_FILENAME,
+            compression=config.page_compression,
         )
         session = Page(session_id=session_id, url=url, url_hash=url_hash, content_path=content_path)
         db_session.add(session)
         db_session.commit()
         return session.id, False
+
+
+def get_page_url_hashes(config: CommonConfig, session_id: int) -> Set[str]:
+    with config.db_client.transaction() as db_session:
+        return {url_hash for url_hash, in db_session.query(Page.url_hash).filter(Page.session_id == session_id)}
+
+
+"""Add pages given as (url, content) in one statement, skipping urls the session already has a page for.
+Returns (page id, cached) for each page in the order given"""
+def add_pages(config: CommonConfig, session_id: int, pages: List[Tuple[str, str]]) -> List[Tuple[int, bool]]:
+    url_hashes = [hash_url(url) for url, _ in pages]
+    with config.db_client.transaction() as db_session:
+        cached = dict(
+            db_session.query(Page.url_hash, Page.id)
+                .filter(Page.session_id == session_id)
+                .filter(Page.url_hash.in_(set(url_hashes)))
+                .all()
+        )
+        rows = {}
+        for url_hash, (url, content) in zip(url_hashes, pages):
+            if url_hash in cached or url_hash in rows:
+                continue
+            content_path = save_blob(
+                content=content,
+                cache_dir=config.cache_dir,
+                compression=config.page_compression,
+            )
+            rows[url_hash] = dict(session_id=session_id, url=url, url_hash=url_hash, content_path=content_path)
+        page_ids = {}
+        if rows:
+            page_ids = dict(db_session.execute(
+                insert(Page).returning(Page.url_hash, Page.id),
+                list(rows.values()),
+            ).all())
+            db_session.commit()
+        ret = []
+        for url_hash in url_hashes:
+            if url_hash in cached:
+                ret += [(cached[url_hash], True)]
+            else:
+                # repeated urls are cached after their first occurrence
+                ret += [(page_ids[url_hash], False)]
+                cached[url_hash] = page_ids[url_hash]
+        return ret
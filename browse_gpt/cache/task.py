@@ -1,5 +1,6 @@
 from ..db import DBClient
 from ..model import Task
+from ..util import hash_text
 
 
 # session_id | is_root | is_leaf | parent_id | subtask_position | context
@@ -25,6 +26,7 @@ def new_task(
             parent_id=parent_id,
             subtask_position=subtask_position,
             context=task_description,
+            context_hash=hash_text(task_description),
         )
         db_session.add(task)
         db_session.commit()
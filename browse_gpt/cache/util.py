@@ -1,6 +1,7 @@
 from typing import List
 from sqlalchemy import text
 from ..db import DBClient
+from ..util import hash_text
 
 
 def get_context_for_page(db_client: DBClient, url_hash: str) -> str:
@@ -12,6 +13,7 @@ def get_context_for_page(db_client: DBClient, url_hash: str) -> str:
                     COALESCE(description, context) AS context,
                     xpath
                 FROM elements
+                JOIN element_contents ON element_contents.id = content_id
                 JOIN pages ON pages.id = page_id
                 WHERE pages.url_hash = :url_hash
                     AND context != ''
@@ -26,10 +28,11 @@ def get_context_for_page_id(db_client: DBClient, page_id: str) -> str:
         return db_session.execute(
             text("""
                 SELECT
-                    id,
+                    elements.id,
                     COALESCE(description, context) AS context,
                     xpath
                 FROM elements
+                JOIN element_contents ON element_contents.id = content_id
                 WHERE page_id = :page_id
                     AND context != ''
                     AND is_root
@@ -42,12 +45,13 @@ def get_group_context_for_page(db_client: DBClient, url_hash: str):
     with db_client.transaction() as db_session:
         return db_session.execute(
             text("""
-                SELECT t2.element_position, string_agg(t1.context, '\\n') context
+                SELECT t2.element_position, string_agg(c1.context, '\\n') context
                 FROM elements t1
+                JOIN element_contents c1 ON c1.id = t1.content_id
                 JOIN elements t2 ON t1.parent_id = t2.id
                 JOIN pages ON pages.id = t2.page_id
                 WHERE pages.url_hash = :url_hash
-                    AND t1.context != ''
+                    AND c1.context != ''
                     AND NOT t1.is_root
                 GROUP BY t2.id, t2.element_position
             """),
@@ -59,11 +63,12 @@ def get_group_context_for_page_id(db_client: DBClient, page_id: str):
     with db_client.transaction() as db_session:
         return db_session.execute(
             text("""
-                SELECT t2.id, t2.element_position, string_agg(t1.context, '\\n') context
+                SELECT t2.id, t2.element_position, string_agg(c1.context, '\\n') context
                 FROM elements t1
+                JOIN element_contents c1 ON c1.id = t1.content_id
                 JOIN elements t2 ON t1.parent_id = t2.id
                 WHERE t2.page_id = :page_id
-                    AND t1.context != ''
+                    AND c1.context != ''
                     AND NOT t1.is_root
                 GROUP BY t2.id, t2.element_position
             """),
@@ -81,10 +86,11 @@ def get_filtered_context_for_page(db_client: DBClient, task_description: str, ur
                 JOIN tasks ON task_id = tasks.id
                 JOIN pages ON page_id = pages.id
                 WHERE
-                    tasks.context = :task_description
+                    tasks.context_hash = :task_hash
+                    AND tasks.context = :task_description
                     AND pages.url_hash = :url_hash
             """),
-            {"task_description": task_description, "url_hash": url_hash},
+            {"task_hash": hash_text(task_description), "task_description": task_description, "url_hash": url_hash},
         ).fetchall()
 
 
@@ -134,12 +140,14 @@ def get_file_url(path: str) -> str:
 
 
 from os import makedirs
+from glob import glob
 import os
 import re
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
 
 from ..config import ParsePageConfig
+from .blob import load_blob, write_atomic, BLOB_ENCODING
 
 MAX_ANNOTATION_ITER = 1000
 DEFAULT_CACHE_DIR = ".cache"
@@ -191,6 +199,23 @@ def parse_annotated_content(annotated_content_string: str) -> List[Tuple[str, st
     return annotated_content
 
 
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split("\n")
+        yield from lines
+    if buffer:
+        yield buffer
+
+
+"""Incremental form of parse_annotated_content for streamed responses with one annotation per line.
+Each annotation is yielded with the text on its line as soon as the line is complete"""
+def iter_annotated_content(chunks: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    for l in iter_lines(chunks):
+        yield from parse_annotated_content(l)
+
+
 def get_workdir() -> str:
     return os.getcwd()
 
@@ -209,9 +234,7 @@ def get_save_path(filename: str, session_id: str, cache_dir: str,  page_id: str,
 
 
 def save_to_path(content: str, path: str) -> str:
-    with open(path, "w+") as f:
-        f.write(content)
-    return path
+    return write_atomic(content.encode(BLOB_ENCODING), path)
 
 
 def save_to_cache(content: str, filename: str, session_id: str, cache_dir: str,  page_id: str, subdir: str = None) -> str:
@@ -225,8 +248,7 @@ def get_load_path(filename: str, session_id: str, cache_dir: str,  page_id: str,
 
 
 def load_from_path(path: str) -> str:
-    with open(path, "r") as f:
-        return f.read()
+    return load_blob(path)
 
 
 def load_from_cache(filename: str, session_id: str, cache_dir: str,  page_id: str, subdir: str = None) -> Tuple[str, str]:
@@ -234,6 +256,10 @@ def load_from_cache(filename: str, session_id: str, cache_dir: str,  page_id: st
     return load_from_path(path), path
 
 
+def list_cached_pages(cache_dir: str, filename: str = PAGE_HTML_FILENAME) -> List[str]:
+    return sorted(glob(os.path.join(cache_dir, "*", "*", filename)))
+
+
 def get_parse_config_id(min_class_overlap: int, min_num_matches: int) -> str:
     return f"{min_class_overlap}co_{min_num_matches}nm"
 
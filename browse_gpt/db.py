@@ -1,25 +1,62 @@
+import logging
 import sqlalchemy
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.session import sessionmaker, Session
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_MAX_OVERFLOW = 10
+DEFAULT_POOL_RECYCLE = 1800  # seconds
+
 
 class DBClient:
 
-    def __init__(self, db_url) -> None:
+    def __init__(
+        self,
+        db_url,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        max_overflow: int = DEFAULT_MAX_OVERFLOW,
+        pool_recycle: int = DEFAULT_POOL_RECYCLE,
+        pool_pre_ping: bool = True,
+        scoped: bool = False,
+    ) -> None:
         self.db_url = db_url
-        self.engine = sqlalchemy.create_engine(db_url)
+        self.engine = sqlalchemy.create_engine(
+            db_url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+        )
+        # with a scoped session each thread reuses its own session, so parallel workers can share one engine
+        self.scoped = scoped
         self.session_factory = sessionmaker(bind=self.engine)
+        if scoped:
+            self.session_factory = scoped_session(self.session_factory)
 
     def transaction(self) -> "ContextManager":
-        return ContextManager(self.session_factory)
+        return ContextManager(self.session_factory, self.engine)
 
     def session(self) -> Session:
         return self.session_factory()
 
+    def pool_status(self) -> str:
+        return self.engine.pool.status()
+
+    def close(self):
+        if self.scoped:
+            self.session_factory.remove()
+        logger.info(f"Closing connection pool. {self.pool_status()}")
+        self.engine.dispose()
+
 
 class ContextManager:
 
-    def __init__(self, session_factory: sessionmaker) -> None:
+    def __init__(self, session_factory: sessionmaker, engine: Engine = None) -> None:
         self.session_factory = session_factory
+        self.engine = engine
         self.session = None
 
     def __enter__(self) -> Session:
@@ -27,7 +64,14 @@ class ContextManager:
         return self.session
 
     def __exit__(self, exc_type, exc_value, tb):
-        if tb is None:
-            self.session.commit()
-        else:
-            self.session.rollback()
+        try:
+            if tb is None:
+                self.session.commit()
+            else:
+                self.session.rollback()
+        finally:
+            # closing returns the connection to the pool; a scoped session is kept for reuse by its thread
+            if not isinstance(self.session_factory, scoped_session):
+                self.session.close()
+            if self.engine is not None:
+                logger.debug(f"Connection pool: {self.engine.pool.status()}")
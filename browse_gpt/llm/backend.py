@@ -0,0 +1,21 @@
+import asyncio
+from functools import partial
+from typing import Dict, Iterator, List
+
+
+"""Interface for services that complete chat messages. Messages and responses are dicts with `role` and `content`"""
+class LLMBackend:
+    # whether responses may be stored in the persistent response cache
+    cacheable: bool = True
+
+    def complete_chat(self, messages: List[Dict[str, str]], model: str) -> Dict[str, str]:
+        raise NotImplementedError
+
+    async def acomplete_chat(self, messages: List[Dict[str, str]], model: str) -> Dict[str, str]:
+        # asyncio.to_thread needs python 3.9
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(self.complete_chat, messages, model))
+
+    """Yield the response content in pieces as it is generated"""
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        yield self.complete_chat(messages, model)["content"]
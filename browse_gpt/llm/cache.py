@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from hashlib import sha256
+from threading import Lock
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_FILENAME = "llm-responses.sqlite"
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def get_cache_key(model: str, messages: List[Dict[str, str]]) -> str:
+    payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return sha256(payload.encode("utf-8")).hexdigest()
+
+
+"""Persistent chat completion cache in a local SQLite database, keyed by model and a hash of the messages.
+Entries older than `ttl` seconds are treated as misses, and once there are more than `max_entries`
+the least recently used entries are evicted"""
+class ResponseCache:
+    def __init__(self, path: str, ttl: int = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        dir = os.path.dirname(path)
+        if dir:
+            os.makedirs(dir, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at_idx ON responses (accessed_at)")
+        self.conn.commit()
+
+    def get(self, key: str) -> Tuple[str, str]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT role, content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[2] > self.ttl:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            role, content, _ = row
+            return role, content
+
+    def put(self, key: str, model: str, role: str, content: str):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, role, content, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, role, content, now, now),
+            )
+            if self.max_entries is not None:
+                self.conn.execute("""
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+            self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses"
+
+    def close(self):
+        logger.info(f"Closing LLM response cache ({self.stats()})")
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,83 @@
+import asyncio
+import re
+import time
+from typing import Dict, Iterator, List
+
+from .backend import LLMBackend
+from ..prompt.template import (
+    FILTER_ELEMENTS_FROM_CONTEXT_TEMPLATE,
+    GENERATE_INPUT_TEXT_TEMPLATE,
+    GENERATED_INPUT_TEXT_PREFIX,
+    LINK_SELECTION_DESCRIPTION_TEMPLATE,
+    TASK_RESPONSE_SEPARATOR,
+)
+from ..cache.util import ANNOTATE_IDX_RE
+
+DEFAULT_MAX_FILTERED_ELEMENTS = 10
+WORD_RE = re.compile(r"[a-z0-9]{3,}")
+
+
+def template_to_regex(template: str) -> re.Pattern:
+    literals = re.split(r"\{\w+\}", template)
+    names = re.findall(r"\{(\w+)\}", template)
+    pattern = re.escape(literals[0])
+    for name, literal in zip(names, literals[1:]):
+        pattern += f"(?P<{name}>.*)" + re.escape(literal)
+    return re.compile(pattern, re.DOTALL)
+
+
+FILTER_ELEMENTS_RE = template_to_regex(FILTER_ELEMENTS_FROM_CONTEXT_TEMPLATE)
+LINK_SELECTION_DESCRIPTION_RE = template_to_regex(LINK_SELECTION_DESCRIPTION_TEMPLATE)
+GENERATE_INPUT_TEXT_RE = template_to_regex(GENERATE_INPUT_TEXT_TEMPLATE)
+
+
+"""Deterministic rule-based stand-in for a chat model, answering the prompts in prompt.template without network
+access. Each request sleeps for `latency` seconds to simulate the API round trip"""
+class LocalBackend(LLMBackend):
+    cacheable = False
+
+    def __init__(self, latency: float = 0., max_filtered_elements: int = DEFAULT_MAX_FILTERED_ELEMENTS):
+        self.latency = latency
+        self.max_filtered_elements = max_filtered_elements
+        self.num_requests = 0
+
+    def complete_chat(self, messages: List[Dict[str, str]], model: str) -> Dict[str, str]:
+        time.sleep(self.latency)
+        return self.respond(messages)
+
+    async def acomplete_chat(self, messages: List[Dict[str, str]], model: str) -> Dict[str, str]:
+        await asyncio.sleep(self.latency)
+        return self.respond(messages)
+
+    """Stream the response line by line, spreading the latency evenly over the lines"""
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        lines = self.respond(messages)["content"].split("\n")
+        for i, line in enumerate(lines):
+            time.sleep(self.latency / len(lines))
+            yield line if i == len(lines) - 1 else line + "\n"
+
+    def respond(self, messages: List[Dict[str, str]]) -> Dict[str, str]:
+        self.num_requests += 1
+        prompt = messages[-1]["content"]
+        content = "I don't know."
+        if match := FILTER_ELEMENTS_RE.fullmatch(prompt):
+            content = self.filter_elements(match["context"], match["task"])
+        elif match := LINK_SELECTION_DESCRIPTION_RE.fullmatch(prompt):
+            first_link = match["context"].strip().split("\n")[0]
+            content = f"The choice being made {TASK_RESPONSE_SEPARATOR}select a link such as {first_link}"
+        elif match := GENERATE_INPUT_TEXT_RE.fullmatch(prompt):
+            content = f"{GENERATED_INPUT_TEXT_PREFIX} {match['task']}"
+        return {"role": "assistant", "content": content}
+
+    """Keep elements sharing words with the task, falling back to the first elements with text"""
+    def filter_elements(self, context: str, task: str) -> str:
+        task_words = set(WORD_RE.findall(task.lower()))
+        elements = []
+        for line in context.split("\n"):
+            found = ANNOTATE_IDX_RE.match(line)
+            text = line[found.end():].strip() if found else ""
+            if found and WORD_RE.search(text.lower()):
+                elements += [(found.group(1), text, len(task_words.intersection(WORD_RE.findall(text.lower()))))]
+        matched = [e for e in elements if e[2] > 0] or elements
+        matched = sorted(matched, key=lambda e: -e[2])[:self.max_filtered_elements]
+        return "\n".join([f"%<{idx}%>: click {text[:40]}" for idx, text, _ in matched])
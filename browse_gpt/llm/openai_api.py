@@ -1,31 +1,209 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
-from typing import List
+from queue import Queue
+from threading import Event
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, TypeVar
+import asyncio
 import os
+import random
 import openai
+import openai.error
 import logging
 
 from ..util import timer
+from .backend import LLMBackend
+from .cache import ResponseCache, get_cache_key
 
 OPENAI_DEFAULT_CHAT_MODEL = "gpt-3.5-turbo"
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_PROMPT_TOKENS = 3000  # leaves room for the response in gpt-3.5-turbo's 4096 token context
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.  # seconds, doubled after each retry
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+
+T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
+_response_cache: ResponseCache = None
+
 
 def set_api_key(key: str):
     openai.api_key = key
 
 
+def set_response_cache(cache: ResponseCache):
+    global _response_cache
+    _response_cache = cache
+
+
+def get_response_cache() -> ResponseCache:
+    return _response_cache
+
+
+def set_backend(backend: LLMBackend):
+    global _backend
+    _backend = backend
+
+
+def get_backend() -> LLMBackend:
+    return _backend
+
+
 def extract_response(chat_api_response):
-    return OpenAIChatMessage(**chat_api_response["choices"][0]["message"])
+    return chat_api_response["choices"][0]["message"]
+
+
+class OpenAIBackend(LLMBackend):
+    def complete_chat(self, messages: List[Dict[str, str]], model: str) -> Dict[str, str]:
+        return extract_response(openai.ChatCompletion.create(model=model, messages=messages))
+
+    async def acomplete_chat(self, messages: List[Dict[str, str]], model: str) -> Dict[str, str]:
+        return extract_response(await openai.ChatCompletion.acreate(model=model, messages=messages))
+
+    def stream_chat(self, messages: List[Dict[str, str]], model: str) -> Iterator[str]:
+        for chunk in openai.ChatCompletion.create(model=model, messages=messages, stream=True):
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                yield content
+
+
+_backend: LLMBackend = OpenAIBackend()
+
+
+def get_cached_response(key: str) -> "OpenAIChatMessage":
+    if _response_cache is None or not _backend.cacheable:
+        return None
+    cached = _response_cache.get(key)
+    logger.debug(f"Response cache {'miss' if cached is None else 'hit'} ({_response_cache.stats()})")
+    if cached is not None:
+        role, content = cached
+        return OpenAIChatMessage(content=content, role=OpenAIChatMessageRole(role))
+
+
+def cache_response(key: str, openai_model: str, message: Dict[str, str]) -> "OpenAIChatMessage":
+    response = OpenAIChatMessage(content=message["content"], role=OpenAIChatMessageRole(message["role"]))
+    if _response_cache is not None and _backend.cacheable:
+        _response_cache.put(key, model=openai_model, role=response.role.value, content=response.content)
+    return response
 
 
 def complete_chat(context: List["OpenAIChatMessage"], openai_model: str = OPENAI_DEFAULT_CHAT_MODEL) -> "OpenAIChatMessage":
-    result = openai.ChatCompletion.create(
-        model=openai_model,
-        messages=[ctx.asdict() for ctx in context],
-    )
-    return extract_response(result)
+    messages = [ctx.asdict() for ctx in context]
+    key = get_cache_key(openai_model, messages)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+    return cache_response(key, openai_model, _backend.complete_chat(messages, openai_model))
+
+
+"""Yield response content as it arrives. The full response is cached once the stream completes"""
+def stream_chat(context: List["OpenAIChatMessage"], openai_model: str = OPENAI_DEFAULT_CHAT_MODEL) -> Iterator[str]:
+    messages = [ctx.asdict() for ctx in context]
+    key = get_cache_key(openai_model, messages)
+    cached = get_cached_response(key)
+    if cached is not None:
+        yield cached.content
+        return
+
+    content = []
+    for chunk in _backend.stream_chat(messages, openai_model):
+        content += [chunk]
+        yield chunk
+    cache_response(key, openai_model, {"role": OpenAIChatMessageRole.ASSISTANT.value, "content": "".join(content)})
+
+
+def get_retry_delay(error: openai.error.OpenAIError, attempt: int) -> float:
+    # respect the server's requested delay on rate limits, otherwise back off exponentially with jitter
+    retry_after = (error.headers or {}).get("retry-after")
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return RETRY_BASE_DELAY * 2 ** attempt * (1 + random.random())
+
+
+async def acomplete_chat(context: List["OpenAIChatMessage"], openai_model: str = OPENAI_DEFAULT_CHAT_MODEL) -> "OpenAIChatMessage":
+    messages = [ctx.asdict() for ctx in context]
+    key = get_cache_key(openai_model, messages)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            message = await _backend.acomplete_chat(messages, openai_model)
+            break
+        except RETRYABLE_ERRORS as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = get_retry_delay(e, attempt)
+            logger.warning(f"OpenAI API request failed ({type(e).__name__}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+    return cache_response(key, openai_model, message)
+
+
+"""Run coroutine functions with at most `max_concurrency` running at once. Results are returned in order"""
+async def run_concurrently(funcs: List[Callable[[], Awaitable[T]]], max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> List[T]:
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(func: Callable[[], Awaitable[T]]) -> T:
+        async with semaphore:
+            return await func()
+
+    return await asyncio.gather(*[run(func) for func in funcs])
+
+
+"""Consume iterables, such as streamed responses, with at most `max_concurrency` read at once, yielding their items
+as they arrive. Items of one iterable keep their order. Closing the generator cancels the iterables not yet started
+and stops the others at their next item"""
+def iter_concurrently(funcs: List[Callable[[], Iterable[T]]], max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> Iterator[T]:
+    items = Queue()
+    stopped = Event()
+    done = object()
+
+    def run(func: Callable[[], Iterable[T]]):
+        try:
+            # a stream is only opened if the consumer is still reading
+            if stopped.is_set():
+                return
+            for item in func():
+                if stopped.is_set():
+                    break
+                items.put((item, None))
+        except Exception as e:
+            items.put((None, e))
+        finally:
+            items.put((done, None))
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-stream")
+    futures = []
+    try:
+        for func in funcs:
+            futures += [executor.submit(run, func)]
+        num_running = len(funcs)
+        while num_running > 0:
+            item, e = items.get()
+            if e is not None:
+                raise e
+            if item is done:
+                num_running -= 1
+                continue
+            yield item
+    finally:
+        stopped.set()
+        # cancel_futures needs python 3.9
+        for f in futures:
+            f.cancel()
+        executor.shutdown(wait=False)
 
 
 def single_response(message: str, openai_model: str = OPENAI_DEFAULT_CHAT_MODEL) -> "OpenAIChatMessage":
@@ -38,6 +216,22 @@ def single_response(message: str, openai_model: str = OPENAI_DEFAULT_CHAT_MODEL)
     return response
 
 
+def stream_single_response(message: str, openai_model: str = OPENAI_DEFAULT_CHAT_MODEL) -> Iterator[str]:
+    logger.info(f"Streaming OpenAI API response (message length={len(message)})...")
+    logger.debug(f'Message: """{message}"""')
+    with timer() as t:
+        yield from stream_chat(context=[OpenAIChatMessage(content=message)], openai_model=openai_model)
+    logger.info(f"Done. ({t.seconds()}s)")
+
+
+async def asingle_response(message: str, openai_model: str = OPENAI_DEFAULT_CHAT_MODEL) -> str:
+    logger.debug(f"Querying OpenAI API (message length={len(message)})...")
+    with timer() as t:
+        response = (await acomplete_chat(context=[OpenAIChatMessage(content=message)], openai_model=openai_model)).content
+    logger.debug(f"Done. ({t.seconds()}s)")
+    return response
+
+
 class OpenAIChatMessageRole(Enum):
     SYSTEM = "system"
     USER = "user"
@@ -0,0 +1,37 @@
+import logging
+import re
+from typing import Dict
+
+from .openai_api import OPENAI_DEFAULT_CHAT_MODEL
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# fallback when no BPE encoding is available: words and punctuation, counting one token per 4 characters of a word
+APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+APPROX_CHARS_PER_TOKEN = 4
+
+_encodings: Dict[str, "tiktoken.Encoding"] = {}
+
+
+def get_encoding(model: str) -> "tiktoken.Encoding":
+    if model not in _encodings:
+        encoding = None
+        if tiktoken is not None:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except Exception as e:
+                logger.warning(f"Failed to load tokenizer for {model} ({e}), approximating token counts")
+        _encodings[model] = encoding
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str = OPENAI_DEFAULT_CHAT_MODEL) -> int:
+    encoding = get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return sum([-(-len(t) // APPROX_CHARS_PER_TOKEN) for t in APPROX_TOKEN_RE.findall(text)])
@@ -1,19 +1,22 @@
-from sqlalchemy import Column, BigInteger, Text, JSON, Boolean, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, BigInteger, Integer, Text, JSON, Boolean, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+# SQLite only autoincrements INTEGER primary keys, used for local runs without postgres
+PrimaryKey = BigInteger().with_variant(Integer, "sqlite")
+
 class Session(Base):
     __tablename__ = "sessions"
-    id = Column(BigInteger, primary_key=True)
+    id = Column(PrimaryKey, primary_key=True)
     tag = Column(Text, nullable=False, unique=True)
     config = Column(JSON)
     pages = relationship("Page", backref="session")
 
 class Page(Base):
     __tablename__ = "pages"
-    id = Column(BigInteger, primary_key=True)
+    id = Column(PrimaryKey, primary_key=True)
     session_id = Column(BigInteger, ForeignKey("sessions.id"), nullable=False)
     url = Column(Text, nullable=False)
     url_hash = Column(Text, index=True, nullable=False)
@@ -26,30 +29,40 @@ class Page(Base):
 
 class Element(Base):
     __tablename__ = "elements"
-    id = Column(BigInteger, primary_key=True)
+    id = Column(PrimaryKey, primary_key=True)
     page_id = Column(BigInteger, ForeignKey("pages.id"), nullable=False)
     is_root = Column(Boolean, index=True, server_default="t")
     is_leaf = Column(Boolean, index=True, server_default="t")
     parent_id = Column(BigInteger, ForeignKey("elements.id"))
     xpath = Column(Text, nullable=False)
     element_position = Column(BigInteger, nullable=False)
-    outer_html = Column(Text, nullable=False)
-    context = Column(Text, nullable=False)
+    content_id = Column(BigInteger, ForeignKey("element_contents.id"), index=True, nullable=False)
+    description = Column(Text)
     filtered_by = relationship("FilteredElement", backref="element")
 
     __table_args__ = (
         UniqueConstraint("page_id", "parent_id", "element_position", name="elements_page_id_parent_id_position_uix"),
     )
 
+# outer HTML and context shared by identical elements, e.g. headers and footers repeated across a site's pages
+class ElementContent(Base):
+    __tablename__ = "element_contents"
+    id = Column(PrimaryKey, primary_key=True)
+    content_hash = Column(Text, nullable=False, unique=True)
+    outer_html = Column(Text, nullable=False)
+    context = Column(Text, nullable=False)
+    elements = relationship("Element", backref="content")
+
 class Task(Base):
     __tablename__ = "tasks"
-    id = Column(BigInteger, primary_key=True)
+    id = Column(PrimaryKey, primary_key=True)
     session_id = Column(BigInteger, ForeignKey("sessions.id"), nullable=False)
     is_root = Column(Boolean, index=True, server_default="f")
     is_leaf = Column(Boolean, index=True, server_default="f")
     parent_id = Column(BigInteger, ForeignKey("tasks.id"), index=True)
     subtask_position = Column(BigInteger)
     context = Column(Text, nullable=False)
+    context_hash = Column(Text, index=True)
     actions = relationship("Action", backref="task")
     subtasks = relationship("Task", backref= "parent", remote_side=[id])
 
@@ -59,7 +72,7 @@ class Task(Base):
 
 class Action(Base):
     __tablename__ = "actions"
-    id = Column(BigInteger, primary_key=True)
+    id = Column(PrimaryKey, primary_key=True)
     task_id = Column(BigInteger, ForeignKey("tasks.id"), nullable=False)
     element_id = Column(BigInteger, ForeignKey("elements.id"), index=True, nullable=False)
     new_page_id = Column(BigInteger, ForeignKey("pages.id"), index=True)
@@ -73,7 +86,7 @@ class Action(Base):
 
 class FilteredElement(Base):
     __tablename__ = "filtered_elements"
-    id = Column(BigInteger, primary_key=True)
+    id = Column(PrimaryKey, primary_key=True)
     task_id = Column(BigInteger, ForeignKey("tasks.id"), nullable=False)
     element_id = Column(BigInteger, ForeignKey("elements.id"), index=True, nullable=False)
     description = Column("description", Text)
@@ -81,3 +94,14 @@ class FilteredElement(Base):
     __table_args__ = (
         UniqueConstraint("task_id", "element_id", name="filtered_elements_task_id_element_id_uix"),
     )
+
+# elements a task's filtering prompt was sent for and answered in full, whether or not the LLM kept them
+class EvaluatedElement(Base):
+    __tablename__ = "evaluated_elements"
+    id = Column(PrimaryKey, primary_key=True)
+    task_id = Column(BigInteger, ForeignKey("tasks.id"), nullable=False)
+    element_id = Column(BigInteger, ForeignKey("elements.id"), index=True, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("task_id", "element_id", name="evaluated_elements_task_id_element_id_uix"),
+    )
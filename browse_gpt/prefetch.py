@@ -0,0 +1,182 @@
+import logging
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, Iterable, List
+from urllib.parse import urldefrag, urljoin, urlparse
+import requests
+from requests.cookies import RequestsCookieJar
+import undetected_chromedriver as uc
+
+from .config import ParserBackend, DEFAULT_PREFETCH_TTL, DEFAULT_MAX_PREFETCH
+from .browser.resolver import ResolvedElement
+from .processing import DecoratedSoup, parse_page_source
+from .util import hash_page_url
+
+logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = 10.  # seconds
+MAX_WORKERS = 4
+PREFETCH_SCHEMES = ["http", "https"]
+# links that may change state when followed, e.g. /logout or ?action=delete
+MUTATING_LINK_RE = re.compile(
+    r"log-?out|sign-?out|log-?off|delete|remove|destroy|unsubscribe|cancel|confirm|add-?to-?cart|[?&](action|do|token)=",
+    re.IGNORECASE,
+)
+
+
+def get_origin(url: str) -> str:
+    url = urlparse(url)
+    return f"{url.scheme}://{url.netloc}"
+
+
+"""Hrefs of the link candidates, read from the attributes resolved with them"""
+def get_link_hrefs(candidates: Iterable[ResolvedElement]) -> List[str]:
+    hrefs = [e.attrs.get("href") for e in candidates if e is not None and e.tag_name == "a"]
+    return [href for href in hrefs if href and not href.startswith("#")]
+
+
+"""The page links are prefetched from, with the browser's cookies and user agent"""
+class PrefetchSession:
+    __slots__ = ("base_url", "cookies", "headers")
+
+    def __init__(self, base_url: str, cookies: RequestsCookieJar, headers: Dict[str, str]):
+        self.base_url = base_url
+        self.cookies = cookies
+        self.headers = headers
+
+
+class PrefetchedPage:
+    __slots__ = ("url", "fetched_at", "elements")
+
+    def __init__(self, url: str, elements: "Future[List[DecoratedSoup]]"):
+        self.url = url
+        self.fetched_at = time.monotonic()
+        self.elements = elements
+
+
+"""Fetches and parses the pages that link candidates lead to while the agent is still acting on the current page,
+so the next step can skip parsing when the action lands on one of them.
+Pages are fetched over HTTP with the driver's cookies and user agent rather than rendered, so their parse only
+matches the live page for server-rendered content. Only same-origin links are prefetched. Parses are kept for `ttl` seconds"""
+class PagePrefetcher:
+    def __init__(
+        self,
+        parser: ParserBackend = ParserBackend.BS4,
+        max_nodes: int = None,
+        ttl: float = DEFAULT_PREFETCH_TTL,
+        max_pages: int = DEFAULT_MAX_PREFETCH,
+        max_workers: int = MAX_WORKERS,
+    ):
+        self.parser = parser
+        self.max_nodes = max_nodes
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="page-prefetch")
+        self.http = requests.Session()
+        self.pages: Dict[str, PrefetchedPage] = {}
+        self.lock = Lock()
+
+        # metrics
+        self.num_prefetched = 0
+        self.num_failed = 0
+        self.num_hits = 0
+        self.num_misses = 0
+
+    """Read the current page's url and the browser's cookies and user agent, in two round trips to the driver.
+    Cookies keep their domain, so they are not sent to other sites when a fetch is redirected"""
+    def read_session(self, driver: uc.Chrome) -> PrefetchSession:
+        base_url, user_agent = driver.execute_script("return [window.location.href, navigator.userAgent];")
+        cookies = RequestsCookieJar()
+        for c in driver.get_cookies():
+            cookies.set(c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/"), secure=c.get("secure", False))
+        return PrefetchSession(base_url=base_url, cookies=cookies, headers={"User-Agent": user_agent})
+
+    """Prefetch the pages linked from resolved candidates, up to `max_pages` not already cached. Only links to the
+    session page's origin are followed, and links that look like they change state are skipped.
+    Returns the number of pages submitted"""
+    def prefetch_links(self, session: PrefetchSession, candidates: Iterable[ResolvedElement]) -> int:
+        current_key = hash_page_url(session.base_url)
+        origin = get_origin(session.base_url)
+        urls = []
+        for href in get_link_hrefs(candidates):
+            url = urldefrag(urljoin(session.base_url, href))[0]
+            if urlparse(url).scheme not in PREFETCH_SCHEMES or get_origin(url) != origin:
+                continue
+            if MUTATING_LINK_RE.search(url[len(origin):]):
+                logger.debug(f"Not prefetching {url}, which may change state")
+                continue
+            if url in urls or hash_page_url(url) == current_key:
+                continue
+            urls += [url]
+        self.evict_expired()
+        with self.lock:
+            urls = [url for url in urls if hash_page_url(url) not in self.pages][:self.max_pages]
+        for url in urls:
+            self.prefetch(url, session)
+        return len(urls)
+
+    def prefetch(self, url: str, session: PrefetchSession):
+        # registered under the lock so the page is cached before the fetch can finish
+        with self.lock:
+            elements = self.executor.submit(self.fetch_and_parse, url, session.cookies, session.headers)
+            self.pages[hash_page_url(url)] = PrefetchedPage(url=url, elements=elements)
+        logger.debug(f"Prefetching {url}")
+
+    def fetch_and_parse(self, url: str, cookies: RequestsCookieJar, headers: Dict[str, str]) -> List[DecoratedSoup]:
+        try:
+            response = self.http.get(url, cookies=cookies, headers=headers, timeout=FETCH_TIMEOUT)
+            response.raise_for_status()
+            if "html" not in response.headers.get("Content-Type", "text/html"):
+                raise Exception(f"Not an HTML page: {response.headers['Content-Type']}")
+            elements = parse_page_source(response.text, parser=self.parser, max_nodes=self.max_nodes, compact=True)
+        except Exception as e:
+            with self.lock:
+                self.num_failed += 1
+            logger.debug(f"Failed to prefetch {url}: {e}")
+            raise
+        with self.lock:
+            self.num_prefetched += 1
+            # redirects land the browser on the final url, so key the parse under it too
+            final_key = hash_page_url(response.url)
+            if final_key not in self.pages:
+                self.pages[final_key] = self.pages.get(hash_page_url(url))
+        return elements
+
+    """Take the parse of a prefetched page if it finished within the last `ttl` seconds. Prefetches still in
+    flight are not waited on, since the page has already been loaded by the time this is called"""
+    def pop(self, url: str) -> List[DecoratedSoup]:
+        self.evict_expired()
+        with self.lock:
+            page = self.pages.pop(hash_page_url(url), None)
+            hit = page is not None and page.elements.done() and page.elements.exception() is None
+            if hit:
+                self.num_hits += 1
+            else:
+                self.num_misses += 1
+        if not hit:
+            return None
+        logger.info(f"Using prefetched parse of {page.url}")
+        return page.elements.result()
+
+    def evict_expired(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [key for key, page in self.pages.items() if page is None or now - page.fetched_at > self.ttl]
+            for key in expired:
+                del self.pages[key]
+
+    def metrics(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "prefetched": self.num_prefetched,
+                "failed": self.num_failed,
+                "hits": self.num_hits,
+                "misses": self.num_misses,
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.http.close()
+        logger.info(f"Closed page prefetcher. {self.metrics()}")
@@ -1,15 +1,20 @@
 from bs4.element import NavigableString, Tag
 from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver import Chrome
 from selenium.webdriver.common.by import By
 from undetected_chromedriver.webelement import WebElement
 import numpy as np
-from typing import List, Set, Tuple, Dict, Union
+from typing import Any, Callable, List, Set, TextIO, Tuple, Dict, Union
 import logging
+import re
 
-from .config import MIN_CLASS_OVERLAP, MIN_NUM_MATCHES
-from .util import timer
+from .config import MIN_CLASS_OVERLAP, MIN_NUM_MATCHES, ParserBackend
+from .browser.snapshot import DOMSnapshot, NodeSnapshot, take_dom_snapshot
+from .browser.resolver import ResolvedElement, resolve_interactive_elements
+from .util import timer, hash_text
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +52,26 @@ INTERACTIVE_ATTRIBUTES = {"role": INTERACTIVE_ROLES, "placeholder": None}
 TEXT_INPUT_ELEMENTS = ["input"]
 TEXT_INPUT_ATTRIBUTES = {"role": TEXT_INPUT_ROLES, "placeholder": None}
 
+# attributes kept for each element in a PageIndex
+INDEXED_ATTRIBUTES = sorted(set(INTERACTIVE_ATTRIBUTES) | set(TEXT_INPUT_ATTRIBUTES) | {"aria-label"})
+
+# elements whose text bs4 stores as special string types, excluded from extracted context
+STRING_CONTAINER_ELEMENTS = ["script", "style", "template", "rt", "rp"]
+
+LXML_PATH_STEP_RE = re.compile(r"(/[^/\[\]]+)(?=/|$)")
+XPATH_STEP_RE = re.compile(r"^(.+)\[(\d+)\]$")
+
+
+"""Merkle-style hash of a subtree from its node's own tag, attributes and text and the hashes of its children,
+so identical subtrees hash the same wherever they appear"""
+def hash_subtree(local: str, child_hashes: List[str]) -> str:
+    return hash_text("\n".join([local] + child_hashes))
+
+
+def format_node(tag_name: str, attrs: Dict[str, Any], texts: List[str]) -> str:
+    attrs = [f"{k}={' '.join(v) if isinstance(v, list) else v}" for k, v in sorted(attrs.items())]
+    return "\0".join([tag_name] + attrs + texts)
+
 
 def make_child_xpath(parent_xpath: str, child_tag_name: str, child_tag_idx: int) -> str:
     return f"{parent_xpath}/{child_tag_name}[{child_tag_idx + 1}]"
@@ -65,71 +90,150 @@ def _format_css_query(keep_attrs: Dict[str, List[str]] = {}, keep_elems: List[st
     return query
 
 
-def is_special(e: Union[Tag, WebElement], keep_attrs: Dict[str, List[str]] = {}, keep_elems: List[str] = []):
-    if isinstance(keep_attrs, list):
-        keep_attrs = {attr: None for attr in keep_attrs}
-    tag_name = e.name if isinstance(e, Tag) else e.tag_name
-    if tag_name in keep_elems:
-        return True
-    for a in keep_attrs:
+"""Matches elements by tag name or by attributes, where an attribute either only needs to be set (None) or needs
+one of the listed values. Built once per set of criteria, with the equivalent CSS selector precomputed"""
+class ElementMatcher:
+    __slots__ = ("tags", "attrs", "css_query")
+
+    def __init__(self, keep_elems: List[str] = [], keep_attrs: Union[Dict[str, List[str]], List[str]] = {}):
+        if isinstance(keep_attrs, list):
+            keep_attrs = {attr: None for attr in keep_attrs}
+        self.tags = frozenset(keep_elems)
+        self.attrs = tuple((a, None if values is None else frozenset(values)) for a, values in keep_attrs.items())
+        self.css_query = _format_css_query(keep_attrs=keep_attrs, keep_elems=keep_elems)
+
+    def matches(self, e: Union[Tag, etree._Element, WebElement]) -> bool:
+        # parse tree nodes hold their attributes in a dict, so they are looked up without further calls
         if isinstance(e, Tag):
-            attr_value = e.attrs.get(a)
+            tag_name, get_attribute = e.name, e.attrs.get
+        elif isinstance(e, etree._Element):
+            tag_name, get_attribute = e.tag, e.attrib.get
         else:
-            attr_value = e.get_attribute(a)
-        if attr_value is not None and (keep_attrs[a] is None or keep_attrs[a] == attr_value):
+            tag_name, get_attribute = e.tag_name, e.get_attribute
+        if tag_name in self.tags:
             return True
+        for a, values in self.attrs:
+            value = get_attribute(a)
+            if value is not None and (values is None or value in values):
+                return True
+        return False
 
-    return False
+
+INTERACTIVE_MATCHER = ElementMatcher(keep_elems=INTERACTIVE_ELEMENTS, keep_attrs=INTERACTIVE_ATTRIBUTES)
+TEXT_INPUT_MATCHER = ElementMatcher(keep_elems=TEXT_INPUT_ELEMENTS, keep_attrs=TEXT_INPUT_ATTRIBUTES)
 
 
 def extract_first_interactive_from_outer_html(e: WebElement) -> WebElement:
     if is_interactive_element(e):
         return e
-    return e.find_element(
-        by=By.CSS_SELECTOR,
-        value=_format_css_query(keep_attrs=INTERACTIVE_ATTRIBUTES, keep_elems=INTERACTIVE_ELEMENTS)
+    return e.find_element(by=By.CSS_SELECTOR, value=INTERACTIVE_MATCHER.css_query)
+
+
+"""Batch counterpart of extract_first_interactive_from_outer_html: finds the first interactive element for
+every xpath in one round trip to the driver, with the attributes needed by INTERACTIVE_MATCHER and TEXT_INPUT_MATCHER
+and link targets. None where not found"""
+def resolve_first_interactive(driver: Chrome, xpaths: List[str]) -> List[ResolvedElement]:
+    return resolve_interactive_elements(
+        driver=driver,
+        xpaths=xpaths,
+        selector=INTERACTIVE_MATCHER.css_query,
+        attr_names=INDEXED_ATTRIBUTES + ["href"],
     )
 
 
-def is_interactive_element(e: Union[Tag, WebElement]):
-    return is_special(e=e, keep_attrs=INTERACTIVE_ATTRIBUTES, keep_elems=INTERACTIVE_ELEMENTS)
+"""Elements parsed with index_contents answer from the flag computed while indexing"""
+def is_interactive_element(e: Union[Tag, WebElement, "DecoratedSoup", "IndexedElement"]):
+    interactive = getattr(e, "interactive", None)
+    if interactive is not None:
+        return interactive
+    return INTERACTIVE_MATCHER.matches(e)
+
 
+def is_text_input(e: Union[Tag, WebElement, "DecoratedSoup", "IndexedElement"]):
+    text_input = getattr(e, "text_input", None)
+    if text_input is not None:
+        return text_input
+    return TEXT_INPUT_MATCHER.matches(e)
 
-def is_text_input(e: Union[Tag, WebElement]):
-    return is_special(e=e, keep_attrs=TEXT_INPUT_ATTRIBUTES, keep_elems=TEXT_INPUT_ELEMENTS)
 
+def assignment_to_groups(sections: List["DecoratedSoup"], element_group_assignment: np.ndarray) -> List[List["DecoratedSoup"]]:
+    element_groups = [[] for _ in range(element_group_assignment.max() + 1 if len(sections) else 0)]
+    for s, group_idx in zip(sections, element_group_assignment):
+        element_groups[group_idx] += [s]
+    return element_groups
 
+
+"""Assign each element to the group of its first (lowest index) preceding match, starting a new group
+when there is none"""
 def adjacency_matrix_to_groups(sections: List["DecoratedSoup"], adj: np.ndarray) -> Tuple[List[List["DecoratedSoup"]], np.ndarray]:
+    rows, cols = adj.nonzero()
+    preceding = cols < rows
+    first_match = np.zeros(len(sections), np.int64) + len(sections)
+    np.minimum.at(first_match, rows[preceding], cols[preceding])
+    first_match[first_match == len(sections)] = -1
+
     # gather element groups
-    element_groups = []
     element_group_assignment = np.zeros(len(sections), np.int64) - 1
-    for i in range(len(sections)):
-        if element_group_assignment[i] < 0:
-            group_members, = np.where(adj[i])
-            assigned = False
-            for j in group_members:
-                if j >= i:
-                    break
-
-                # set i = j
-                element_group_assignment[i] = element_group_assignment[j]
-                element_groups[element_group_assignment[i]] += [sections[i]]
-                assert sum([len(g) for g in element_groups]) == i + 1, "1"
-                assigned = True
-                break
-                    
+    num_groups = 0
+    for i, j in enumerate(first_match):
+        if j < 0:
             # no match with previously seen elements
-            if not assigned:
-                # add new group
-                element_group_assignment[i] = len(element_groups)
-                element_groups += [[sections[i]]]
-                assert sum([len(g) for g in element_groups]) == i + 1, "2"
-            
-        assert sum([len(g) for g in element_groups]) == i + 1, "3"
-        
-    assert sum([len(g) for g in element_groups]) == len(sections), "4"
-    
-    return element_groups, element_group_assignment
+            element_group_assignment[i] = num_groups
+            num_groups += 1
+        else:
+            element_group_assignment[i] = element_group_assignment[j]
+
+    return assignment_to_groups(sections, element_group_assignment), element_group_assignment
+
+
+"""Split groups with fewer than `min_num_matches` members into singleton groups, preserving group order"""
+def split_small_groups(
+        sections: List["DecoratedSoup"],
+        element_group_assignment: np.ndarray,
+        min_num_matches: int,
+) -> Tuple[List[List["DecoratedSoup"]], np.ndarray]:
+    group_sizes = np.bincount(element_group_assignment)
+    is_split = (1 < group_sizes) & (group_sizes < min_num_matches)
+    new_group_sizes = np.where(is_split, group_sizes, 1)
+    new_group_offsets = np.cumsum(new_group_sizes) - new_group_sizes
+
+    # position of each element within its group
+    order = np.argsort(element_group_assignment, kind="stable")
+    group_offsets = np.cumsum(group_sizes) - group_sizes
+    rank = np.zeros(len(sections), np.int64)
+    rank[order] = np.arange(len(sections)) - group_offsets[element_group_assignment[order]]
+
+    new_element_group_assignment = new_group_offsets[element_group_assignment] + np.where(is_split[element_group_assignment], rank, 0)
+    assert np.all(new_element_group_assignment >= 0)
+    return assignment_to_groups(sections, new_element_group_assignment), new_element_group_assignment
+
+
+"""Map each distinct class string to an integer id.
+Returns (section index, class id) coordinates of the section-class incidence matrix and the number of classes"""
+def intern_classes(all_classes: List[Set[str]]) -> Tuple[np.ndarray, np.ndarray, int]:
+    class_ids = {}
+    section_idxs = []
+    class_idxs = []
+    for i, classes in enumerate(all_classes):
+        for c in classes:
+            class_idxs += [class_ids.setdefault(c, len(class_ids))]
+        section_idxs += [i] * len(classes)
+    return np.array(section_idxs, np.int64), np.array(class_idxs, np.int64), len(class_ids)
+
+
+def compute_pairwise_class_overlap(all_classes: List[Set[str]]) -> np.ndarray:
+    section_idxs, class_idxs, num_classes = intern_classes(all_classes)
+
+    # classes held by a single section only contribute to the diagonal, so drop them
+    # before building the incidence matrix to keep the matrix product small
+    shared = np.bincount(class_idxs, minlength=num_classes)[class_idxs] > 1
+    shared_class_ids, shared_class_idxs = np.unique(class_idxs[shared], return_inverse=True)
+    incidence = np.zeros((len(all_classes), len(shared_class_ids)), np.float32)
+    incidence[section_idxs[shared], shared_class_idxs] = 1
+
+    pairwise_class_overlap = incidence @ incidence.T
+    np.fill_diagonal(pairwise_class_overlap, [len(classes) for classes in all_classes])
+    return pairwise_class_overlap
 
 
 # TODO using columnwise max overlap as minimum
@@ -141,11 +245,8 @@ def group_sections_by_class_overlap(
         min_num_matches: int = MIN_NUM_MATCHES,
 ) -> Tuple[List[List[str]], Dict["DecoratedSoup", int], np.ndarray]:
     # compute pairwise class overlap
-    pairwise_class_overlap = np.ndarray([len(sections)] * 2)
-    for i, (_, classes) in enumerate(zip(sections, all_classes)):
-        for j, (_, classes_) in enumerate(zip(sections, all_classes)):
-            pairwise_class_overlap[i, j] = len(classes.intersection(classes_))
-    
+    pairwise_class_overlap = compute_pairwise_class_overlap(all_classes)
+
     # naive: fixed overlap threshold
     element_match = pairwise_class_overlap >= min_overlap
     diag_filter = ~np.diag(np.ones(pairwise_class_overlap.shape[0])).astype('bool')
@@ -162,24 +263,8 @@ def group_sections_by_class_overlap(
     element_groups, element_group_assignment = adjacency_matrix_to_groups(sections, element_match)
 
     if min_num_matches > 1:
-        group_idx = 0
-        new_element_groups = []
-        new_element_group_assignment = np.zeros_like(element_group_assignment) - 1
-        for g in element_groups:
-            in_g_element_mask = np.array([sections[i] in g for i in range(len(element_group_assignment))])
-            if 1 < len(g) < min_num_matches:
-                new_element_group_assignment[in_g_element_mask] = np.arange(group_idx, group_idx + len(g))
-                new_element_groups += [[e] for e in g]
-                group_idx += len(g)
-            else:
-                new_element_group_assignment[in_g_element_mask] = group_idx
-                new_element_groups += [g]
-                group_idx += 1
+        element_groups, element_group_assignment = split_small_groups(sections, element_group_assignment, min_num_matches)
 
-        element_groups = new_element_groups
-        element_group_assignment = new_element_group_assignment  # TODO debug
-        assert np.all(element_group_assignment) >= 0
-    
     return element_groups, {e: idx for e, idx in zip(sections, element_group_assignment)}, element_match
 
 
@@ -212,6 +297,20 @@ def get_driver_elem(
     return driver_elem, xpath
 
 
+def get_snapshot_node(
+    snapshot: DOMSnapshot,
+    parent_xpath: str,
+    tag_name: str,
+    tag_idx: int,
+) -> Tuple[NodeSnapshot, str]:
+    xpath = parent_xpath + f'/{tag_name}[{tag_idx + 1}]'
+    node = snapshot.get(xpath)
+    if node is None:
+        xpath = parent_xpath + f'/*[name()="{tag_name}"][{tag_idx + 1}]'
+        node = snapshot.get(xpath)
+    return node, xpath
+
+
 def extract_context(s: Tag, attrs: List[str] = ['aria-label', 'placeholder'], all_text: bool = False) -> Tuple[str, Dict[str, str]]:
     attr_dict = {}
     for attr in attrs:
@@ -235,39 +334,87 @@ def extract_and_format_context(s: Tag, attrs: List[str] = ['aria-label', 'placeh
     return context.strip()
 
 
-def get_current_page_context(driver: Chrome) -> List["DecoratedSoup"]:
+"""lxml counterpart of extract_context: collects the element's own text and the tails of its children,
+skipping text held by `string_container` elements the same way bs4 does"""
+def extract_lxml_context(e: etree._Element, attrs: List[str] = ['aria-label', 'placeholder'], string_container: str = None) -> Tuple[str, Dict[str, str]]:
+    attr_dict = {attr: e.attrib[attr] for attr in attrs if attr in e.attrib}
+    text = ''
+    if string_container is None:
+        if e.text is not None:
+            text += '\n' + format_text_newline(e.text)
+        for c in e:
+            if c.tail is not None:
+                text += '\n' + format_text_newline(c.tail)
+    return text.strip(), attr_dict
+
+
+def extract_and_format_lxml_context(e: etree._Element, attrs: List[str] = ['aria-label', 'placeholder'], string_container: str = None) -> str:
+    context = ''
+    text, attr_dict = extract_lxml_context(e, attrs=attrs, string_container=string_container)
+    for attr in attr_dict:
+        context += '\n' + f'{attr}: {attr_dict[attr]}'
+    context += '\n' + text
+    return context.strip()
+
+
+"""Convert an lxml path (`/html/body/div[2]`) to the xpath format used by DecoratedSoup (`//html[1]/body[1]/div[2]`)"""
+def format_lxml_path(path: str) -> str:
+    return "/" + LXML_PATH_STEP_RE.sub(r"\1[1]", path)
+
+
+"""Parse the page currently loaded in the driver. With `use_snapshot`, element visibility is read from
+a single DOM snapshot instead of querying the driver for every element"""
+def get_current_page_context(driver: Chrome, use_snapshot: bool = True, max_nodes: int = None) -> List["DecoratedSoup"]:
     logger.info("Parsing page content...")
     with timer() as t:
-        root_elem = BeautifulSoup(driver.page_source).find()
+        snapshot = None
+        if use_snapshot:
+            snapshot = take_dom_snapshot(driver)
+            logger.debug(f"Took DOM snapshot of {len(snapshot)} elements ({t.seconds()}s)")
+            page_source = snapshot.html
+        else:
+            page_source = driver.page_source
+        root_elem = BeautifulSoup(page_source).find()
         ds = DecoratedSoup(
             soup=root_elem,
             tag_name=root_elem.name,
             tag_idx=0,
             parent_xpath="/",
             driver=driver,
-            query_element=True,
+            query_element=not use_snapshot,
         )
-        _, elems, _ = recurse_get_context(driver=driver, ds=ds)
+        _, elems, _ = recurse_get_context(driver=driver, ds=ds, snapshot=snapshot, max_nodes=max_nodes)
     logger.info(f"Done parsing page content. ({t.seconds()}s)")
     logger.debug(f"Found {sum([isinstance(e, DecoratedSoupGroup) for e in elems])} same-class groups")
     return elems
 
 
-def parse_page_source(page_source: str):
+"""Parse page source, given as a string or a text stream (see cache.blob.open_blob), into filtered elements.
+With `compact`, elements are returned as views into a PageIndex and the parse tree is released"""
+def parse_page_source(page_source: Union[str, TextIO], parser: ParserBackend = ParserBackend.BS4, max_nodes: int = None, compact: bool = False):
     logger.info("Parsing page content...")
     with timer() as t:
-        root_elem = BeautifulSoup(page_source).find()
-        ds = DecoratedSoup(
-            soup=root_elem,
-            tag_name=root_elem.name,
-            tag_idx=0,
-            parent_xpath="/",
-        )
-        elems, _ = ds.index_contents()
+        if parser == ParserBackend.LXML:
+            elems = parse_page_source_lxml(page_source, max_nodes=max_nodes)
+        else:
+            root_elem = BeautifulSoup(page_source).find()
+            ds = DecoratedSoup(
+                soup=root_elem,
+                tag_name=root_elem.name,
+                tag_idx=0,
+                parent_xpath="/",
+            )
+            elems, _ = ds.index_contents(max_nodes=max_nodes)
+
+            # format context for elements
+            for e in elems:
+                e.context = extract_and_format_context(e.soup)
 
-    # format context for elements
-    for e in elems:
-        e.context = extract_and_format_context(e.soup)
+        if compact:
+            elems = PageIndex(elems).elements()
+            if parser == ParserBackend.BS4:
+                # bs4 trees hold reference cycles, so break them rather than waiting on the garbage collector
+                root_elem.decompose()
 
     logger.info(f"Done parsing page content. ({t.seconds()}s)")
     # TODO add same-class group identification
@@ -275,20 +422,83 @@ def parse_page_source(page_source: str):
     return elems
 
 
-def recurse_get_context(
+def parse_page_source_lxml(page_source: Union[str, TextIO], max_nodes: int = None) -> List["LxmlDecoratedSoup"]:
+    # huge_tree lifts libxml2's default nesting depth limit of 256
+    html_parser = lxml.html.HTMLParser(huge_tree=True)
+    if isinstance(page_source, str):
+        root_elem = lxml.html.document_fromstring(page_source, parser=html_parser)
+    else:
+        # parse incrementally from the stream instead of reading it into one string first
+        root_elem = lxml.html.parse(page_source, parser=html_parser).getroot()
+    # compute all paths before unwrapping elements changes sibling positions
+    tree = root_elem.getroottree()
+    xpaths = {e: format_lxml_path(tree.getpath(e)) for e in root_elem.iter(etree.Element)}
+    ds = LxmlDecoratedSoup(soup=root_elem, xpath=xpaths[root_elem])
+    elems, _ = ds.index_contents(xpaths=xpaths, max_nodes=max_nodes)
+    return elems
+
+
+"""Rebuild an element from stored outer HTML, e.g. for filtered elements retrieved from the db"""
+def element_from_outer_html(outer_html: str, xpath: str) -> "LxmlDecoratedSoup":
+    tag_name, _ = XPATH_STEP_RE.match(xpath.rsplit("/", 1)[-1]).groups()
+    if tag_name in ["html", "head", "body"]:
+        # document-level elements are dropped when parsed as fragments
+        root_elem = lxml.html.document_fromstring(outer_html)
+        soup = root_elem if tag_name == "html" else root_elem.find(tag_name)
+    else:
+        soup = lxml.html.fragment_fromstring(outer_html)
+    e = LxmlDecoratedSoup(soup=soup, xpath=xpath)
+    e.context = extract_and_format_lxml_context(e.soup)
+    e.interactive = INTERACTIVE_MATCHER.matches(e.soup)
+    e.text_input = TEXT_INPUT_MATCHER.matches(e.soup)
+    return e
+
+
+"""Iterative post-order fold over a DOM tree using an explicit stack.
+`expand(node)` returns (state, children to descend into) and `combine(node, state, child_results)`
+returns the node's result, where `child_results` holds a (child, result) pair per visited child.
+Once `max_nodes` nodes have been expanded no further children are visited, and the remaining nodes
+are combined with the results collected so far"""
+def walk_dom(
+    root: Any,
+    expand: Callable[[Any], Tuple[Any, List[Any]]],
+    combine: Callable[[Any, Any, List[Tuple[Any, Any]]], Any],
+    max_nodes: int = None,
+) -> Any:
+    state, children = expand(root)
+    stack = [(root, state, iter(children), [])]
+    num_nodes = 1
+    while True:
+        node, state, children, child_results = stack[-1]
+        child = next(children, None)
+        if child is not None:
+            if max_nodes is None or num_nodes < max_nodes:
+                num_nodes += 1
+                child_state, grandchildren = expand(child)
+                stack += [(child, child_state, iter(grandchildren), [])]
+                continue
+            if num_nodes == max_nodes:
+                logger.warning(f"Reached node budget ({max_nodes}), skipping remaining elements")
+                num_nodes += 1
+        stack.pop()
+        result = combine(node, state, child_results)
+        if not stack:
+            return result
+        stack[-1][3].append((node, result))
+
+
+def expand_context(
     driver: Chrome,
     ds: "DecoratedSoup",
+    xpath: str,
     attrs: List[str] = ['aria-label', 'placeholder'],
-    xpath: str = '/html',
-) -> Tuple[List[str], List["DecoratedSoup"], List[List["DecoratedSoup"]]]:
+    snapshot: DOMSnapshot = None,
+) -> Tuple[Tuple["DecoratedSoup", List[List["DecoratedSoup"]]], List[Tuple["DecoratedSoup", str]]]:
     context = extract_and_format_context(ds.soup, attrs=attrs)
     if context:
         ds.context = context
-        return [context], [ds], []
-    descendent_context = []
+        return (ds, None), []
     class_sets = []
-    ds_elems = []
-    ds_elem_groups = []
     elem_groups: List[List[DecoratedSoup]] = []
     live_children = []
     tag_idxs = {}
@@ -302,29 +512,43 @@ def recurse_get_context(
                 tag_idx=tag_idxs[c.name],
                 parent_xpath=xpath,
                 driver=driver,
-                query_element=True,
+                query_element=snapshot is None,
+                snapshot=snapshot,
             )
-            if dc is None:
-                logger.error(f"Failed to find element for xpath: {xpath}/{c.name}[{tag_idxs[c.name]}]")
-                continue
             tag_idxs[c.name] += 1
             if dc.is_live():
                 class_sets += [recurse_get_classes(c)]
                 live_children += [dc]
-    
+
     if len(live_children) > 1:
         # check for same-class groups
         elem_groups, _, _ = group_sections_by_class_overlap(live_children, class_sets)
-        # logger.debug(ds.soup.name)
-        # logger.debug([len(g) for g in elem_groups])
     elif len(live_children) > 0:
         elem_groups = [live_children]
 
+    # descend into elements that were not grouped with their siblings
+    return (ds, elem_groups), [(g[0], g[0].xpath) for g in elem_groups if len(g) == 1]
+
+
+def combine_context(
+    state: Tuple["DecoratedSoup", List[List["DecoratedSoup"]]],
+    child_results: List[Tuple[Tuple["DecoratedSoup", str], Tuple[List[str], List["DecoratedSoup"], List["DecoratedSoupGroup"]]]],
+    attrs: List[str] = ['aria-label', 'placeholder'],
+) -> Tuple[List[str], List["DecoratedSoup"], List["DecoratedSoupGroup"]]:
+    ds, elem_groups = state
+    if elem_groups is None:
+        return [ds.context], [ds], []
+    descendent_context = []
+    ds_elems = []
+    ds_elem_groups = []
+    results = {id(dc): result for (dc, _), result in child_results}
     for g in elem_groups:
         dc, *_ = g
         if len(g) == 1:
-            # logger.debug(f'recursing to {str(dc.soup)[:30]}')
-            context, elems, elem_groups_ = recurse_get_context(driver=driver, ds=dc, xpath=dc.xpath)
+            if id(dc) not in results:
+                # skipped after reaching the node budget
+                continue
+            context, elems, elem_groups_ = results[id(dc)]
             descendent_context += context
             ds_elems += elems
             ds_elem_groups += elem_groups_
@@ -335,13 +559,29 @@ def recurse_get_context(
             descendent_context += ['']
             ds_elem_groups += [soup_group]
             ds_elems += [soup_group]
-            
-    # logger.debug(f'found groups for {ds.soup.name}: {[len(g) for g in elem_groups]}')
 
     return descendent_context, ds_elems, ds_elem_groups
 
 
+def recurse_get_context(
+    driver: Chrome,
+    ds: "DecoratedSoup",
+    attrs: List[str] = ['aria-label', 'placeholder'],
+    xpath: str = '/html',
+    snapshot: DOMSnapshot = None,
+    max_nodes: int = None,
+) -> Tuple[List[str], List["DecoratedSoup"], List["DecoratedSoupGroup"]]:
+    return walk_dom(
+        root=(ds, xpath),
+        expand=lambda node: expand_context(driver, *node, attrs=attrs, snapshot=snapshot),
+        combine=lambda _, state, child_results: combine_context(state, child_results, attrs=attrs),
+        max_nodes=max_nodes,
+    )
+
+
 class DecoratedSoup:
+    __slots__ = ("driver", "parent_xpath", "tag_name", "tag_idx", "soup", "context", "driver_elem", "node_snapshot", "xpath", "subtree_hash", "interactive", "text_input")
+
     def __init__(
         self,
         soup: Tag,
@@ -350,6 +590,7 @@ class DecoratedSoup:
         parent_xpath: str = '/',
         driver: Chrome = None,
         query_element: bool = False,
+        snapshot: DOMSnapshot = None,
     ):
         self.driver = driver
         self.parent_xpath = parent_xpath
@@ -358,11 +599,22 @@ class DecoratedSoup:
         self.soup = soup
         self.context = ''
         self.driver_elem = None
+        self.node_snapshot = None
+        self.subtree_hash = None
+        self.interactive = None
+        self.text_input = None
         self.xpath = make_child_xpath(
             parent_xpath=parent_xpath,
             child_tag_name=tag_name,
             child_tag_idx=tag_idx,
         )
+        if snapshot is not None:
+            self.node_snapshot, self.xpath = get_snapshot_node(
+                snapshot=snapshot,
+                parent_xpath=parent_xpath,
+                tag_name=tag_name,
+                tag_idx=tag_idx,
+            )
         if query_element:
             self.query_driver_element()
 
@@ -383,9 +635,14 @@ class DecoratedSoup:
         return self.driver_elem
         
     def is_live(self) -> bool:
+        if self.driver_elem is None and self.node_snapshot is not None:
+            return self.node_snapshot.visible
+        if self.driver_elem is None:
+            logger.debug(f"No element found for xpath: {self.xpath}")
+            return False
         return self.driver_elem.is_displayed()
     
-    """Traverse recursively through contents, indexing non-filtered elements as we go.
+    """Traverse through contents, indexing non-filtered elements as we go.
     Filtered if ALL of the following apply:
     - No text content
     - Not interactive
@@ -393,17 +650,29 @@ class DecoratedSoup:
     Returns:
     - children: list of all DecoratedSoup elements in child content
     - unwrap: boolean, whether to unwrap the element based on above filtering
+    Each visited element's subtree_hash is set as the walk returns from it
     """
-    def index_contents(self, driver: Chrome = None, query_driver: bool = False) -> Tuple[List["DecoratedSoup"], bool]:
+    def index_contents(self, driver: Chrome = None, query_driver: bool = False, max_nodes: int = None) -> Tuple[List["DecoratedSoup"], bool]:
+        return walk_dom(
+            root=self,
+            expand=lambda ds: ds.expand_contents(driver=driver, query_driver=query_driver),
+            combine=lambda ds, state, child_results: ds.combine_contents(state, child_results),
+            max_nodes=max_nodes,
+        )
+
+    def expand_contents(self, driver: Chrome = None, query_driver: bool = False) -> Tuple[Tuple[bool, int, str], List["DecoratedSoup"]]:
+        self.interactive = INTERACTIVE_MATCHER.matches(self.soup)
+        self.text_input = TEXT_INPUT_MATCHER.matches(self.soup)
         tag_idxs = {}
-        all_children = []
+        children = []
         has_text = False
         num_children = 0
+        texts = []
 
-        for e in self.soup.children:
+        for e in list(self.soup.children):
             if isinstance(e, Tag):
                 num_children += 1
-                if e not in tag_idxs:
+                if e.name not in tag_idxs:
                     tag_idxs[e.name] = 0
                 ds = DecoratedSoup(
                     soup=e,
@@ -417,29 +686,262 @@ class DecoratedSoup:
                     logger.warning(f"Failed to find element for xpath: {self.xpath}/{e.name}[{tag_idxs[e.name]}]")
                     e.extract()
                     continue
-                children, unwrap = ds.index_contents()
-                all_children += children
-                if unwrap:
-                    ds.soup.unwrap()
-                else:
-                    all_children += [ds]
+                tag_idxs[e.name] += 1
+                children += [ds]
             elif isinstance(e, NavigableString):
                 has_text = True
+                texts += [str(e)]
             else:
                 e.extract()
 
+        # hashed before children are unwrapped into this element
+        return (has_text, num_children, format_node(self.soup.name, self.soup.attrs, texts)), children
+
+    def combine_contents(self, state: Tuple[bool, int, str], child_results: List[Tuple["DecoratedSoup", Tuple[List["DecoratedSoup"], bool]]]) -> Tuple[List["DecoratedSoup"], bool]:
+        has_text, num_children, local = state
+        self.subtree_hash = hash_subtree(local, [ds.subtree_hash for ds, _ in child_results])
+        all_children = []
+        for ds, (children, unwrap) in child_results:
+            all_children += children
+            if unwrap:
+                ds.unwrap()
+            else:
+                all_children += [ds]
+
         # TODO exclude even when parent of multiple children?
-        unwrap_self = not is_interactive_element(self.soup) and not has_text and num_children < 2
+        unwrap_self = not self.interactive and not has_text and num_children < 2
         return all_children, unwrap_self
 
+    def unwrap(self):
+        self.soup.unwrap()
+
+    @property
+    def outer_html(self) -> str:
+        return str(self.soup)
+
+    def get_attribute(self, name: str) -> str:
+        value = self.soup.attrs.get(name)
+        if isinstance(value, list):
+            value = " ".join(value)
+        return value
+
+
+class LxmlDecoratedSoup(DecoratedSoup):
+    __slots__ = ("string_container",)
+
+    def __init__(self, soup: etree._Element, xpath: str, string_container: str = None):
+        parent_xpath, step = xpath.rsplit("/", 1)
+        tag_name, tag_idx = XPATH_STEP_RE.match(step).groups()
+        super().__init__(soup=soup, tag_name=tag_name, tag_idx=int(tag_idx) - 1, parent_xpath=parent_xpath)
+        self.string_container = string_container
+
+    """Same filtering as DecoratedSoup.index_contents over an lxml tree. Context is extracted as each
+    element is visited, before any of its children are unwrapped"""
+    def index_contents(self, xpaths: Dict[etree._Element, str], max_nodes: int = None) -> Tuple[List["LxmlDecoratedSoup"], bool]:
+        return walk_dom(
+            root=self,
+            expand=lambda ds: ds.expand_contents(xpaths=xpaths),
+            combine=lambda ds, state, child_results: ds.combine_contents(state, child_results),
+            max_nodes=max_nodes,
+        )
+
+    def expand_contents(self, xpaths: Dict[etree._Element, str]) -> Tuple[Tuple[bool, int, str], List["LxmlDecoratedSoup"]]:
+        children = []
+        has_text = self.soup.text is not None
+        num_children = 0
+        texts = [self.soup.text or ""]
+        self.context = extract_and_format_lxml_context(self.soup, string_container=self.string_container)
+        self.interactive = INTERACTIVE_MATCHER.matches(self.soup)
+        self.text_input = TEXT_INPUT_MATCHER.matches(self.soup)
+
+        for e in self.soup:
+            if e.tail is not None:
+                has_text = True
+                texts += [e.tail]
+            if not isinstance(e.tag, str):
+                # comments and processing instructions
+                has_text = True
+                texts += [e.text or ""]
+                continue
+            num_children += 1
+            children += [LxmlDecoratedSoup(
+                soup=e,
+                xpath=xpaths[e],
+                string_container=e.tag if e.tag in STRING_CONTAINER_ELEMENTS else self.string_container,
+            )]
+
+        return (has_text, num_children, format_node(self.soup.tag, dict(self.soup.attrib), texts)), children
+
+    def unwrap(self):
+        self.soup.drop_tag()
+
+    @property
+    def outer_html(self) -> str:
+        return lxml.html.tostring(self.soup, encoding="unicode", with_tail=False)
+
+    def get_attribute(self, name: str) -> str:
+        return self.soup.attrib.get(name)
+
 
 class DecoratedSoupGroup(DecoratedSoup):
+    __slots__ = ("elems", "group_xpath")
+
     def __init__(self, elems: List[DecoratedSoup]):
         self.elems = list(elems)
-        super().__init__(self.elems[0].soup, self.elems[0].xpath, self.elems[0].driver_elem)
+        first, *_ = self.elems
+        super().__init__(
+            soup=first.soup,
+            tag_name=first.tag_name,
+            tag_idx=first.tag_idx,
+            parent_xpath=first.parent_xpath,
+            driver=first.driver,
+        )
+        self.xpath = first.xpath
+        self.driver_elem = first.driver_elem
+        self.node_snapshot = first.node_snapshot
         self.group_xpath = "/".join(self.xpath.split("/")[:-1])
 
 
+"""Columnar storage for parsed elements, so the parse tree can be released once parsing finishes.
+Xpath steps are interned and linked by parent index, so xpaths are rebuilt on demand, and each element's
+context, outer HTML, subtree hash and attributes are stored as spans of one shared text buffer. Outer HTML of an element
+nested in another stored element points into its ancestor's span rather than being copied"""
+class PageIndex:
+    def __init__(self, elements: List[DecoratedSoup], attrs: List[str] = INDEXED_ATTRIBUTES):
+        self.fields = ["context", "outer_html", "subtree_hash"] + list(attrs)
+        tag_ids = {}
+        step_ids = {}
+        path_ids = {}
+        step_idxs = []
+        parent_idxs = []
+        elem_tag_ids = []
+        elem_paths = []
+        interactive = []
+        text_input = []
+
+        for e in elements:
+            if isinstance(e, DecoratedSoupGroup):
+                raise Exception("Same-class element groups cannot be stored in a PageIndex")
+            elem_tag_ids += [tag_ids.setdefault(e.tag_name, len(tag_ids))]
+            interactive += [is_interactive_element(e)]
+            text_input += [is_text_input(e)]
+
+            # intern each xpath prefix as (parent prefix, step)
+            path = []
+            path_idx = -1
+            for step in e.xpath.split("/"):
+                step_id = step_ids.setdefault(step, len(step_ids))
+                key = (path_idx, step_id)
+                if key not in path_ids:
+                    path_ids[key] = len(path_ids)
+                    step_idxs += [step_id]
+                    parent_idxs += [path_idx]
+                path_idx = path_ids[key]
+                path += [path_idx]
+            elem_paths += [path]
+
+        text = []
+        text_len = 0
+        spans = np.full((len(elements), len(self.fields), 2), -1, np.int64)
+        html_spans = {}
+        # visit ancestors before descendants so nested outer HTML can be found in an ancestor's span
+        for i in sorted(range(len(elements)), key=lambda i: len(elem_paths[i])):
+            e = elements[i]
+            for j, value in enumerate([e.context, e.outer_html, e.subtree_hash] + [e.get_attribute(a) for a in attrs]):
+                if value is None:
+                    continue
+                if j == 1:
+                    for path_idx in reversed(elem_paths[i][:-1]):
+                        if path_idx in html_spans:
+                            ancestor_html, ancestor_start = html_spans[path_idx]
+                            offset = ancestor_html.find(value)
+                            if offset >= 0:
+                                spans[i, j] = ancestor_start + offset, ancestor_start + offset + len(value)
+                            break
+                    if spans[i, j, 0] >= 0:
+                        continue
+                    html_spans[elem_paths[i][-1]] = value, text_len
+                spans[i, j] = text_len, text_len + len(value)
+                text += [value]
+                text_len += len(value)
+
+        self.tag_names = list(tag_ids)
+        self.step_names = list(step_ids)
+        self.step_idxs = np.array(step_idxs, np.int32)
+        self.parent_idxs = np.array(parent_idxs, np.int64)
+        self.tag_ids = np.array(elem_tag_ids, np.int32)
+        self.interactive = np.array(interactive, bool)
+        self.text_input = np.array(text_input, bool)
+        self.path_idxs = np.array([path[-1] for path in elem_paths], np.int64)
+        self.text = "".join(text)
+        self.spans = spans
+
+    def __len__(self):
+        return len(self.tag_ids)
+
+    def get_value(self, idx: int, field: str) -> str:
+        start, end = self.spans[idx, self.fields.index(field)]
+        if start < 0:
+            return None
+        return self.text[start:end]
+
+    def get_xpath(self, idx: int) -> str:
+        steps = []
+        path_idx = self.path_idxs[idx]
+        while path_idx >= 0:
+            steps += [self.step_names[self.step_idxs[path_idx]]]
+            path_idx = self.parent_idxs[path_idx]
+        return "/".join(reversed(steps))
+
+    def elements(self) -> List["IndexedElement"]:
+        return [IndexedElement(self, i) for i in range(len(self))]
+
+
+"""Read-only view of one element in a PageIndex, exposing the DecoratedSoup fields used after parsing.
+Interactivity is read from flags computed while indexing, and attribute lookups use the WebElement interface"""
+class IndexedElement:
+    __slots__ = ("page_index", "idx")
+
+    def __init__(self, page_index: PageIndex, idx: int):
+        self.page_index = page_index
+        self.idx = idx
+
+    @property
+    def tag_name(self) -> str:
+        return self.page_index.tag_names[self.page_index.tag_ids[self.idx]]
+
+    @property
+    def xpath(self) -> str:
+        return self.page_index.get_xpath(self.idx)
+
+    @property
+    def context(self) -> str:
+        return self.page_index.get_value(self.idx, "context")
+
+    @property
+    def outer_html(self) -> str:
+        return self.page_index.get_value(self.idx, "outer_html")
+
+    @property
+    def subtree_hash(self) -> str:
+        return self.page_index.get_value(self.idx, "subtree_hash")
+
+    @property
+    def interactive(self) -> bool:
+        return bool(self.page_index.interactive[self.idx])
+
+    @property
+    def text_input(self) -> bool:
+        return bool(self.page_index.text_input[self.idx])
+
+    def get_attribute(self, name: str) -> str:
+        if name == "outerHTML":
+            return self.outer_html
+        if name not in self.page_index.fields[3:]:
+            raise Exception(f"Attribute `{name}` was not stored in the page index")
+        return self.page_index.get_value(self.idx, name)
+
+
 def _test():
     import os
     from cache.util import load_from_cache, get_load_path, get_workdir, PAGE_HTML_FILENAME
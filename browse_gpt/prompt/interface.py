@@ -1,10 +1,12 @@
+import asyncio
 import logging
-from typing import List, Union
+from typing import Iterable, Iterator, List, Tuple, Union
 from undetected_chromedriver.webelement import WebElement
 
-from .template import format_describe_selection_prompt, extract_selection_description, format_filter_elements_prompt, extract_filtered_elements, extract_generated_input_text, format_generate_input_text_prompt, TaskContext
-from ..llm.openai_api import single_response
-from ..processing import DecoratedSoupGroup, DecoratedSoup
+from .template import chunk_filter_elements_context, format_describe_selection_prompt, extract_selection_description, format_filter_elements_prompt, extract_filtered_elements, extract_generated_input_text, format_generate_input_text_prompt, iter_filtered_elements, TaskContext
+from ..llm.openai_api import single_response, asingle_response, stream_single_response, run_concurrently, iter_concurrently, DEFAULT_MAX_CONCURRENCY
+from ..cache.util import iter_annotated_content
+from ..processing import DecoratedSoupGroup, DecoratedSoup, IndexedElement
 
 logger = logging.getLogger(__name__)
 
@@ -17,12 +19,120 @@ def describe_selection(group_ctx: str) -> str:
     return extract_selection_description(message)
 
 
+async def adescribe_selection(group_ctx: str) -> str:
+    prompt = format_describe_selection_prompt(group_ctx=group_ctx)
+    message = await asingle_response(prompt)
+    return extract_selection_description(message)
+
+
+"""Describe the choices for all groups on a page, querying the LLM for each group concurrently"""
+def describe_selections(group_ctxs: List[str], max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> List[str]:
+    return asyncio.run(run_concurrently(
+        [lambda group_ctx=group_ctx: adescribe_selection(group_ctx) for group_ctx in group_ctxs],
+        max_concurrency=max_concurrency,
+    ))
+
+
 """Select an element to interact with given its extracted text.
-Returns identifier corresponding to the selected context"""
-def filter_context(ctx: List[str], website: str, task_description: str) -> List[str]:
-    prompt = format_filter_elements_prompt(page_ctx=ctx, website=website, task_description=task_description)
-    message = single_response(prompt)
-    return extract_filtered_elements(message)
+Returns identifier corresponding to the selected context.
+With `max_tokens`, context is split into chunks whose prompts fit the budget and the chunks are filtered concurrently"""
+def filter_context(
+    ctx: List[str],
+    website: str,
+    task_description: str,
+    max_tokens: int = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+) -> List[Tuple[int, str]]:
+    chunks = [list(range(len(ctx)))]
+    if max_tokens is not None:
+        chunks = chunk_filter_elements_context(page_ctx=ctx, website=website, task_description=task_description, max_tokens=max_tokens)
+    if len(chunks) == 1:
+        prompt = format_filter_elements_prompt(page_ctx=ctx, website=website, task_description=task_description)
+        message = single_response(prompt)
+        return extract_filtered_elements(message)
+
+    logger.info(f"Filtering context in {len(chunks)} chunks...")
+    chunk_results = asyncio.run(run_concurrently(
+        [
+            lambda chunk=chunk: afilter_context_chunk(ctx=ctx, indexes=chunk, website=website, task_description=task_description)
+            for chunk in chunks
+        ],
+        max_concurrency=max_concurrency,
+    ))
+    return [filtered for result in chunk_results for filtered in result]
+
+
+"""Streaming form of filter_context, yielding each (index, action) as soon as its line of the response arrives.
+Context split into several chunks is filtered concurrently, yielding lines from each chunk's response as they arrive.
+Indexes of chunks whose response was read to the end are added to `evaluated`, so lines of chunks that failed or
+were stopped early can be told from ones the LLM left out"""
+def stream_filter_context(
+    ctx: List[str],
+    website: str,
+    task_description: str,
+    max_tokens: int = None,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    evaluated: List[int] = None,
+) -> Iterator[Tuple[int, str]]:
+    chunks = [list(range(len(ctx)))]
+    if max_tokens is not None:
+        chunks = chunk_filter_elements_context(page_ctx=ctx, website=website, task_description=task_description, max_tokens=max_tokens)
+    if len(chunks) == 1:
+        prompt = format_filter_elements_prompt(page_ctx=ctx, website=website, task_description=task_description)
+        yield from iter_evaluated(iter_filtered_elements(iter_annotated_content(stream_single_response(prompt))), chunks[0], evaluated)
+        return
+
+    logger.info(f"Filtering context in {len(chunks)} chunks...")
+    yield from iter_concurrently(
+        [
+            lambda chunk=chunk: iter_evaluated(
+                stream_filter_context_chunk(ctx=ctx, indexes=chunk, website=website, task_description=task_description),
+                chunk,
+                evaluated,
+            )
+            for chunk in chunks
+        ],
+        max_concurrency=max_concurrency,
+    )
+
+
+def format_filter_context_chunk_prompt(ctx: List[str], indexes: List[int], website: str, task_description: str) -> str:
+    return format_filter_elements_prompt(
+        page_ctx=[ctx[i] for i in indexes],
+        website=website,
+        task_description=task_description,
+        indexes=indexes,
+    )
+
+
+"""Yield a chunk's filtered elements, then add the chunk's indexes to `evaluated` once its response is exhausted"""
+def iter_evaluated(filtered_elements: Iterable[Tuple[int, str]], indexes: List[int], evaluated: List[int] = None) -> Iterator[Tuple[int, str]]:
+    yield from filtered_elements
+    if evaluated is not None:
+        evaluated.extend(indexes)
+
+
+"""Drop filtered elements whose index is not in the chunk"""
+def iter_chunk_filtered_elements(filtered_elements: Iterable[Tuple[int, str]], indexes: List[int]) -> Iterator[Tuple[int, str]]:
+    indexes = set(indexes)
+    for idx, action in filtered_elements:
+        if idx not in indexes:
+            logger.warning(f"LLM returned element index outside of the filtered chunk: {idx}")
+            continue
+        yield idx, action
+
+
+"""Filter the context lines at `indexes`, which are annotated with their index in the full page context"""
+async def afilter_context_chunk(ctx: List[str], indexes: List[int], website: str, task_description: str) -> List[Tuple[int, str]]:
+    prompt = format_filter_context_chunk_prompt(ctx=ctx, indexes=indexes, website=website, task_description=task_description)
+    message = await asingle_response(prompt)
+    return list(iter_chunk_filtered_elements(extract_filtered_elements(message), indexes))
+
+
+"""Streaming form of afilter_context_chunk"""
+def stream_filter_context_chunk(ctx: List[str], indexes: List[int], website: str, task_description: str) -> Iterator[Tuple[int, str]]:
+    prompt = format_filter_context_chunk_prompt(ctx=ctx, indexes=indexes, website=website, task_description=task_description)
+    yield from iter_chunk_filtered_elements(iter_filtered_elements(iter_annotated_content(stream_single_response(prompt))), indexes)
 
 
 """Select an action from abbreviated HTML context.
@@ -32,9 +142,9 @@ def select_action(dsg: DecoratedSoupGroup, task_ctx: TaskContext) -> List[Decora
 
 
 """Generate text to input into an HTML input field element"""
-def get_text_input_for_field(e: Union[DecoratedSoup, WebElement], website: str, task_description: str) -> str:
-    if isinstance(e, DecoratedSoup):
-        outer_html = str(e)
+def get_text_input_for_field(e: Union[DecoratedSoup, IndexedElement, WebElement], website: str, task_description: str) -> str:
+    if isinstance(e, (DecoratedSoup, IndexedElement)):
+        outer_html = e.outer_html
     else:
         outer_html = e.get_attribute("outerHTML")
     prompt = format_generate_input_text_prompt(
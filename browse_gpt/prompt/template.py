@@ -1,8 +1,10 @@
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
 import logging
 import re
 
 from ..cache.util import parse_annotated_content
+from ..llm.openai_api import OPENAI_DEFAULT_CHAT_MODEL
+from ..llm.tokenizer import count_tokens
 
 # TODO get make scripts for prompting workflow:
 # 1. Describing selection list and caching
@@ -76,11 +78,47 @@ def format_describe_selection_prompt(group_ctx: str) -> str:
     return LINK_SELECTION_DESCRIPTION_TEMPLATE.format(context=group_ctx)
 
 
-def format_filter_elements_prompt(page_ctx: List[str], website: str, task_description: str) -> str:
-    context = "\n".join([f"%<{i}%> {ctx}" for i, ctx in enumerate(page_ctx)])
+def format_filter_elements_line(idx: int, ctx: str) -> str:
+    return f"%<{idx}%> {ctx}"
+
+
+"""`indexes` gives the annotation for each context line, defaulting to its position in `page_ctx`"""
+def format_filter_elements_prompt(page_ctx: List[str], website: str, task_description: str, indexes: List[int] = None) -> str:
+    if indexes is None:
+        indexes = range(len(page_ctx))
+    context = "\n".join([format_filter_elements_line(i, ctx) for i, ctx in zip(indexes, page_ctx)])
     return FILTER_ELEMENTS_FROM_CONTEXT_TEMPLATE.format(site=website, context=context, task=task_description)
 
 
+"""Pack consecutive context lines into chunks whose filter prompts stay within `max_tokens`.
+Returns the indexes of the lines in each chunk. A line that exceeds the budget on its own gets its own chunk"""
+def chunk_filter_elements_context(
+    page_ctx: List[str],
+    website: str,
+    task_description: str,
+    max_tokens: int,
+    model: str = OPENAI_DEFAULT_CHAT_MODEL,
+) -> List[List[int]]:
+    budget = max_tokens - count_tokens(format_filter_elements_prompt([], website, task_description), model=model)
+    chunks = []
+    chunk = []
+    chunk_tokens = 0
+    for i, ctx in enumerate(page_ctx):
+        # count the newline joining this line to the previous one
+        num_tokens = count_tokens(format_filter_elements_line(i, ctx) + "\n", model=model)
+        if chunk and chunk_tokens + num_tokens > budget:
+            chunks += [chunk]
+            chunk = []
+            chunk_tokens = 0
+        if num_tokens > budget:
+            logger.warning(f"Context for element {i} exceeds the prompt token budget ({num_tokens} > {budget})")
+        chunk += [i]
+        chunk_tokens += num_tokens
+    if chunk:
+        chunks += [chunk]
+    return chunks
+
+
 def format_action_selection_prompt(task_ctx: "TaskContext", page_ctx: str) -> str:
     return ACTION_SELECTION_TEMPLATE.format(
         site=task_ctx.site,
@@ -107,9 +145,13 @@ def extract_selection_description(description: str) -> str:
         return split[1]
 
 
-def extract_filtered_elements(response: str) -> List[Tuple[str, str]]:
-    idx_action = []
-    for ann, action_response in parse_annotated_content(response):
+def extract_filtered_elements(response: str) -> List[Tuple[int, str]]:
+    return list(iter_filtered_elements(parse_annotated_content(response)))
+
+
+"""Yield (element index, action) for each well-formed annotation, e.g. as a streamed response is parsed"""
+def iter_filtered_elements(annotated_content: Iterable[Tuple[str, str]]) -> Iterator[Tuple[int, str]]:
+    for ann, action_response in annotated_content:
         try:
             action, = STRIP_NON_ALNUM_RE.findall(action_response)
         except ValueError:
@@ -118,8 +160,7 @@ def extract_filtered_elements(response: str) -> List[Tuple[str, str]]:
         if not ann.isnumeric():
             logger.warning(f"LLM returned non-numeric element index: {ann}")
             continue
-        idx_action += [(int(ann), action)]
-    return idx_action
+        yield int(ann), action
 
 
 def extract_selected_action(response: str) -> Tuple[int, str]:
@@ -0,0 +1,97 @@
+import logging
+import re
+from typing import List, Tuple
+import numpy as np
+from zlib import crc32
+
+from .config import RankingScorer
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+BM25_K1 = 1.5
+BM25_B = 0.75
+NGRAM_SIZE = 3
+NGRAM_DIM = 2 ** 14
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD_RE.findall(text.lower())
+
+
+"""Okapi BM25 score of each document for the query. Only query terms are counted, so term frequencies
+form a (documents x query terms) matrix built with a single bincount"""
+def score_bm25(docs: List[str], query: str, k1: float = BM25_K1, b: float = BM25_B) -> np.ndarray:
+    query_terms = {t: i for i, t in enumerate(dict.fromkeys(tokenize(query)))}
+    doc_tokens = [tokenize(d) for d in docs]
+    doc_lens = np.array([len(tokens) for tokens in doc_tokens], dtype=np.float32)
+    if not query_terms or not docs:
+        return np.zeros(len(docs), dtype=np.float32)
+
+    doc_idxs, term_idxs = [], []
+    for i, tokens in enumerate(doc_tokens):
+        for t in tokens:
+            if t in query_terms:
+                doc_idxs += [i]
+                term_idxs += [query_terms[t]]
+    tf = np.bincount(
+        np.array(doc_idxs, dtype=np.int64) * len(query_terms) + np.array(term_idxs, dtype=np.int64),
+        minlength=len(docs) * len(query_terms),
+    ).reshape(len(docs), len(query_terms)).astype(np.float32)
+
+    df = (tf > 0).sum(axis=0)
+    idf = np.log((len(docs) - df + .5) / (df + .5) + 1)
+    norm = k1 * (1 - b + b * doc_lens / max(doc_lens.mean(), 1.))
+    return (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+"""Hashed character n-grams of each word in the texts, as (text index, n-gram bucket) pairs"""
+def hash_ngrams(texts: List[str], n: int = NGRAM_SIZE, dim: int = NGRAM_DIM) -> Tuple[np.ndarray, np.ndarray]:
+    row_idxs, col_idxs = [], []
+    for i, text in enumerate(texts):
+        for word in tokenize(text):
+            word = f"<{word}>"
+            for j in range(max(len(word) - n + 1, 1)):
+                row_idxs += [i]
+                col_idxs += [crc32(word[j:j + n].encode("utf-8")) % dim]
+    return np.array(row_idxs, dtype=np.int64), np.array(col_idxs, dtype=np.int64)
+
+
+"""Cosine similarity of hashed n-gram counts of each document and the query. Counts are kept sparse, as
+(document, bucket) pairs, so only the buckets the query has contribute to the dot products"""
+def score_ngram_similarity(docs: List[str], query: str, dim: int = NGRAM_DIM) -> np.ndarray:
+    if not docs:
+        return np.zeros(0, dtype=np.float32)
+    rows, cols = hash_ngrams(docs, dim=dim)
+    _, query_cols = hash_ngrams([query], dim=dim)
+    if len(rows) == 0 or len(query_cols) == 0:
+        return np.zeros(len(docs), dtype=np.float32)
+
+    keys, counts = np.unique(rows * dim + cols, return_counts=True)
+    rows, cols, counts = keys // dim, keys % dim, counts.astype(np.float32)
+    norms = np.sqrt(np.bincount(rows, weights=counts ** 2, minlength=len(docs)))
+
+    query_cols, query_counts = np.unique(query_cols, return_counts=True)
+    query_weights = query_counts / np.linalg.norm(query_counts)
+    idxs = np.minimum(np.searchsorted(query_cols, cols), len(query_cols) - 1)
+    in_query = query_cols[idxs] == cols
+    dots = np.bincount(rows[in_query], weights=counts[in_query] * query_weights[idxs[in_query]], minlength=len(docs))
+    return (dots / np.maximum(norms, 1e-6)).astype(np.float32)
+
+
+def score_contexts(contexts: List[str], query: str, scorer: RankingScorer = RankingScorer.BM25) -> np.ndarray:
+    if scorer == RankingScorer.NGRAM:
+        return score_ngram_similarity(contexts, query)
+    return score_bm25(contexts, query)
+
+
+"""Indexes of the `top_k` contexts scoring highest against the query, in their original (page) order.
+All indexes are returned when `top_k` is None or at least the number of contexts"""
+def rank_contexts(contexts: List[str], query: str, top_k: int = None, scorer: RankingScorer = RankingScorer.BM25) -> List[int]:
+    if top_k is None or top_k >= len(contexts):
+        return list(range(len(contexts)))
+    scores = score_contexts(contexts, query, scorer=scorer)
+    # stable sort so ties keep page order
+    top = np.argsort(-scores, kind="stable")[:top_k]
+    logger.debug(f"Kept {top_k} of {len(contexts)} elements (min score {scores[top].min():.3f})")
+    return sorted(top.tolist())
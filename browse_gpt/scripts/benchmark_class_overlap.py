@@ -0,0 +1,70 @@
+import sys
+import logging
+from typing import List, Set, Tuple
+import numpy as np
+from bs4 import BeautifulSoup
+from bs4.element import Tag
+
+from browse_gpt.config import BenchmarkConfig
+from browse_gpt.cache.util import list_cached_pages, load_from_path
+from browse_gpt.processing import (
+    DecoratedSoup,
+    compute_pairwise_class_overlap,
+    group_sections_by_class_overlap,
+    recurse_get_classes,
+)
+from browse_gpt.util import timer
+
+logger = logging.getLogger(__name__)
+
+
+def compute_pairwise_class_overlap_naive(all_classes: List[Set[str]]) -> np.ndarray:
+    pairwise_class_overlap = np.ndarray([len(all_classes)] * 2)
+    for i, classes in enumerate(all_classes):
+        for j, classes_ in enumerate(all_classes):
+            pairwise_class_overlap[i, j] = len(classes.intersection(classes_))
+    return pairwise_class_overlap
+
+
+def get_sibling_class_sets(page_source: str) -> List[Tuple[List[DecoratedSoup], List[Set[str]]]]:
+    siblings = []
+    for parent in BeautifulSoup(page_source).find_all(True):
+        children = [c for c in parent.children if isinstance(c, Tag)]
+        if len(children) > 1:
+            sections = [DecoratedSoup(soup=c, tag_name=c.name, tag_idx=i) for i, c in enumerate(children)]
+            siblings += [(sections, [recurse_get_classes(c) for c in children])]
+    return siblings
+
+
+def main(config: BenchmarkConfig):
+    for path in list_cached_pages(config.cache_dir):
+        siblings = get_sibling_class_sets(load_from_path(path))
+        logger.info(f"{path}: {len(siblings)} parent nodes, widest has {max([len(s) for s, _ in siblings])} children")
+
+        # verify parity with set intersection
+        for sections, all_classes in siblings:
+            naive = compute_pairwise_class_overlap_naive(all_classes)
+            if not np.array_equal(naive, compute_pairwise_class_overlap(all_classes)):
+                raise Exception(f"Class overlap mismatch under {sections[0].soup.parent.name}")
+            groups, _, _ = group_sections_by_class_overlap(sections, all_classes)
+            assert sum([len(g) for g in groups]) == len(sections)
+
+        with timer() as t:
+            for _ in range(config.num_iter):
+                for _, all_classes in siblings:
+                    compute_pairwise_class_overlap_naive(all_classes)
+        naive_seconds = t.seconds() / config.num_iter
+
+        with timer() as t:
+            for _ in range(config.num_iter):
+                for _, all_classes in siblings:
+                    compute_pairwise_class_overlap(all_classes)
+        vectorized_seconds = t.seconds() / config.num_iter
+
+        logger.info(f"set intersection: {naive_seconds:.4f}s, vectorized: {vectorized_seconds:.4f}s")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(BenchmarkConfig.parse_args()))
@@ -0,0 +1,70 @@
+import sys
+import logging
+from uuid import uuid4
+from sqlalchemy import func, select
+
+from browse_gpt.config import BrowingSessionConfig, LLMBackendOption
+from browse_gpt.cache.session import new_session
+from browse_gpt.cache.task import new_task
+from browse_gpt.cache.util import list_cached_pages, load_from_path, get_file_url
+from browse_gpt.agent import get_potential_actions
+from browse_gpt.llm.openai_api import get_backend
+from browse_gpt.model import Base, Element, ElementContent
+from browse_gpt.util import timer
+
+logger = logging.getLogger(__name__)
+
+EXAMPLE_DIR = "example"
+
+
+def count_rows(config: BrowingSessionConfig) -> tuple:
+    with config.db_client.transaction() as db_session:
+        return (
+            db_session.execute(select(func.count(Element.id))).scalar(),
+            db_session.execute(select(func.count(ElementContent.id))).scalar(),
+        )
+
+
+"""Run the example pages through agent.get_potential_actions in one session with and without reusing the
+filtering of elements shared between pages, reporting rows stored and LLM requests. Run with `--llm-backend local`
+and a sqlite `--db-url` to benchmark offline"""
+def main(config: BrowingSessionConfig):
+    if config.llm_backend != LLMBackendOption.LOCAL:
+        logger.warning("Benchmarking against the OpenAI API, pass `--llm-backend local` to run offline")
+    if config.db_client.engine.dialect.name == "sqlite":
+        Base.metadata.create_all(config.db_client.engine)
+
+    pages = [(path, load_from_path(path)) for path in list_cached_pages(EXAMPLE_DIR)]
+    for reuse in [False, True]:
+        config.reuse_filtered_content = reuse
+        config.session_id = f"benchmark-{uuid4().hex}"
+        session_id, _ = new_session(db_client=config.db_client, config=config)
+        task_id, _ = new_task(db_client=config.db_client, session_id=session_id, task_description=config.task_description)
+
+        num_elements, num_contents = count_rows(config)
+        num_requests = getattr(get_backend(), "num_requests", 0)
+        num_filtered = 0
+        with timer() as t:
+            # visit each page twice, as a session returning to a page with a different url would
+            for i in range(2):
+                for path, page_source in pages:
+                    filtered_ids, _, _ = get_potential_actions(
+                        config=config,
+                        page_source=page_source,
+                        session_id=session_id,
+                        task_id=task_id,
+                        url=f"{get_file_url(path)}?visit={i}",
+                    )
+                    num_filtered += len(filtered_ids)
+        num_elements_, num_contents_ = count_rows(config)
+        logger.info(
+            f"reuse filtered content={reuse}: {t.seconds():.4f}s, {num_elements_ - num_elements} elements, "
+            f"{num_contents_ - num_contents} new contents, {getattr(get_backend(), 'num_requests', 0) - num_requests} LLM requests, "
+            f"{num_filtered} filtered"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(BrowingSessionConfig.parse_args()))
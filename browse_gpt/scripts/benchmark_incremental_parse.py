@@ -0,0 +1,77 @@
+import sys
+import logging
+from uuid import uuid4
+import lxml.html
+
+from browse_gpt.config import BrowingSessionConfig, LLMBackendOption
+from browse_gpt.cache.session import new_session
+from browse_gpt.cache.task import new_task
+from browse_gpt.cache.util import list_cached_pages, load_from_path, get_file_url
+from browse_gpt.agent import get_potential_actions
+from browse_gpt.llm.openai_api import get_backend, set_response_cache
+from browse_gpt.model import Base
+from browse_gpt.util import timer
+
+logger = logging.getLogger(__name__)
+
+EXAMPLE_DIR = "example"
+MODAL_HTML = '<div role="dialog"><p>Select a showtime</p><button aria-label="Close">Close</button><a href="/checkout">Continue to checkout</a></div>'
+
+
+"""Simulate an action that opens a modal, as most clicks only change a small subtree of the page"""
+def open_modal(page_source: str) -> str:
+    root = lxml.html.document_fromstring(page_source)
+    root.find("body").append(lxml.html.fragment_fromstring(MODAL_HTML))
+    return lxml.html.tostring(root, encoding="unicode")
+
+
+def new_benchmark_task(config: BrowingSessionConfig) -> tuple:
+    config.session_id = f"benchmark-{uuid4().hex}"
+    session_id, _ = new_session(db_client=config.db_client, config=config)
+    task_id, _ = new_task(db_client=config.db_client, session_id=session_id, task_description=config.task_description)
+    return session_id, task_id
+
+
+"""Compare a full re-parse of each example page after opening a modal with an incremental re-parse against
+the page as first parsed. Run with `--llm-backend local` and a sqlite `--db-url` to benchmark offline"""
+def main(config: BrowingSessionConfig):
+    if config.llm_backend != LLMBackendOption.LOCAL:
+        logger.warning("Benchmarking against the OpenAI API, pass `--llm-backend local` to run offline")
+    if config.db_client.engine.dialect.name == "sqlite":
+        Base.metadata.create_all(config.db_client.engine)
+    # caching would hide the cost of filtering the unchanged elements again. The response cache is installed
+    # while parsing the config, so it is removed rather than disabled through the flag
+    set_response_cache(None)
+    config.llm_cache = False
+
+    for path in list_cached_pages(EXAMPLE_DIR):
+        # serialize both versions with lxml so only the modal differs between them
+        page_source = lxml.html.tostring(lxml.html.document_fromstring(load_from_path(path)), encoding="unicode")
+        changed_source = open_modal(page_source)
+        url = get_file_url(path)
+        num_requests = lambda: getattr(get_backend(), "num_requests", 0)
+
+        session_id, task_id = new_benchmark_task(config)
+        requests_before = num_requests()
+        with timer() as t:
+            full = get_potential_actions(config=config, page_source=changed_source, session_id=session_id, task_id=task_id, url=url)
+        full_seconds, full_requests = t.seconds(), num_requests() - requests_before
+
+        session_id, task_id = new_benchmark_task(config)
+        parsed_pages = {}
+        get_potential_actions(config=config, page_source=page_source, session_id=session_id, task_id=task_id, url=url, parsed_pages=parsed_pages)
+        requests_before = num_requests()
+        with timer() as t:
+            incremental = get_potential_actions(config=config, page_source=changed_source, session_id=session_id, task_id=task_id, url=url, parsed_pages=parsed_pages)
+        incremental_seconds, incremental_requests = t.seconds(), num_requests() - requests_before
+
+        logger.info(
+            f"{path}: full {full_seconds:.4f}s ({full_requests} LLM requests, {len(full[0])} filtered), "
+            f"incremental {incremental_seconds:.4f}s ({incremental_requests} LLM requests, {len(incremental[0])} filtered)"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(BrowingSessionConfig.parse_args()))
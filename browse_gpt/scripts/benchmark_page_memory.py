@@ -0,0 +1,62 @@
+import sys
+import gc
+import logging
+import resource
+import tracemalloc
+from multiprocessing import Pool
+from typing import Tuple
+
+from browse_gpt.config import BenchmarkConfig, ParserBackend
+from browse_gpt.cache.util import list_cached_pages, load_from_path
+from browse_gpt.processing import parse_page_source
+
+logger = logging.getLogger(__name__)
+
+
+def get_current_rss() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+
+"""Parse a page in a fresh process, returning the peak RSS (MiB) of the process and the memory (MiB) still
+held once parsing returns, while the parsed elements are kept alive as they are in the agent.
+lxml trees live outside the Python heap, so retained memory is reported both as traced Python allocations
+and as the growth in resident memory"""
+def measure_parse(path: str, parser: ParserBackend, compact: bool) -> Tuple[float, float, float, int]:
+    page_source = load_from_path(path)
+    gc.collect()
+    rss = get_current_rss()
+    tracemalloc.start()
+    elems = parse_page_source(page_source, parser=parser, compact=compact)
+    # the agent serializes every element when adding it to the db
+    for e in elems:
+        e.outer_html
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained_rss = get_current_rss() - rss
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak_rss, retained / 2 ** 20, retained_rss, len(elems)
+
+
+def main(config: BenchmarkConfig):
+    for path in list_cached_pages(config.cache_dir):
+        for parser in ParserBackend:
+            results = []
+            for compact in [False, True]:
+                # one process per measurement, so peak RSS is not shared between runs
+                with Pool(1, maxtasksperchild=1) as pool:
+                    results += [pool.apply(measure_parse, (path, parser, compact))]
+            (rss, retained, retained_rss, num_elems), (rss_, retained_, retained_rss_, num_elems_) = results
+            assert num_elems == num_elems_
+            logger.info(
+                f"{path} ({parser.value}, {num_elems} elements): "
+                f"peak RSS {rss:.1f}MiB -> {rss_:.1f}MiB, retained {retained:.2f}MiB -> {retained_:.2f}MiB traced, "
+                f"{retained_rss:.1f}MiB -> {retained_rss_:.1f}MiB resident"
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(BenchmarkConfig.parse_args()))
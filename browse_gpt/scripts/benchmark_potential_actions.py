@@ -0,0 +1,61 @@
+import sys
+import logging
+from uuid import uuid4
+import numpy as np
+
+from browse_gpt.config import BrowingSessionConfig, LLMBackendOption
+from browse_gpt.cache.session import new_session
+from browse_gpt.cache.task import new_task
+from browse_gpt.cache.util import list_cached_pages, load_from_path, get_file_url
+from browse_gpt.agent import get_potential_actions
+from browse_gpt.llm.openai_api import get_backend
+from browse_gpt.model import Base
+from browse_gpt.util import timer
+
+logger = logging.getLogger(__name__)
+
+EXAMPLE_DIR = "example"
+NUM_ITER = 5
+
+
+"""Time agent.get_potential_actions on the example pages. Run with `--llm-backend local` and a sqlite
+`--db-url` (e.g. sqlite:///.cache/benchmark.sqlite) to benchmark without network access"""
+def main(config: BrowingSessionConfig):
+    if config.llm_backend != LLMBackendOption.LOCAL:
+        logger.warning("Benchmarking against the OpenAI API, pass `--llm-backend local` to run offline")
+    if config.db_client.engine.dialect.name == "sqlite":
+        Base.metadata.create_all(config.db_client.engine)
+
+    pages = [(path, load_from_path(path)) for path in list_cached_pages(EXAMPLE_DIR)]
+    durations = {path: [] for path, _ in pages}
+    for _ in range(NUM_ITER):
+        # pages are only processed once per session, so start a new one for each iteration
+        config.session_id = f"benchmark-{uuid4().hex}"
+        session_id, _ = new_session(db_client=config.db_client, config=config)
+        task_id, _ = new_task(
+            db_client=config.db_client,
+            session_id=session_id,
+            task_description=config.task_description,
+        )
+        for path, page_source in pages:
+            with timer() as t:
+                get_potential_actions(
+                    config=config,
+                    page_source=page_source,
+                    session_id=session_id,
+                    task_id=task_id,
+                    url=get_file_url(path),
+                )
+            durations[path] += [t.seconds()]
+
+    for path, seconds in durations.items():
+        logger.info(f"{path}: mean {np.mean(seconds):.4f}s, min {np.min(seconds):.4f}s, max {np.max(seconds):.4f}s")
+    num_requests = getattr(get_backend(), "num_requests", None)
+    if num_requests is not None:
+        logger.info(f"{num_requests} LLM requests")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(BrowingSessionConfig.parse_args()))
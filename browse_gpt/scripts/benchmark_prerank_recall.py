@@ -0,0 +1,52 @@
+import sys
+import logging
+import numpy as np
+
+from browse_gpt.config import CommonConfig, RankingScorer
+from browse_gpt.cache.element import get_filtered_element_ids_by_task
+from browse_gpt.cache.util import get_context_for_page_id
+from browse_gpt.ranking import rank_contexts
+from browse_gpt.util import timer
+
+logger = logging.getLogger(__name__)
+
+TOP_KS = [25, 50, 100, 200]
+
+
+"""Recall@K of each pre-ranking scorer against the elements the LLM kept in previous sessions (filtered_elements),
+i.e. the fraction of LLM-filtered elements that would still be sent to the LLM with `--prerank-top-k K`"""
+def main(config: CommonConfig):
+    filtered = get_filtered_element_ids_by_task(config.db_client)
+    if not filtered:
+        logger.error("No filtered elements found, run the agent on some pages first")
+        return 1
+
+    recalls = {(scorer, k): [] for scorer in RankingScorer for k in TOP_KS}
+    durations = {scorer: 0. for scorer in RankingScorer}
+    num_elements = []
+    for _, page_id, task_context, element_ids in filtered:
+        rows = get_context_for_page_id(db_client=config.db_client, page_id=page_id)
+        ids, contexts, _ = zip(*rows)
+        num_elements += [len(ids)]
+        relevant = set(element_ids).intersection(ids)
+        if not relevant:
+            continue
+        for scorer in RankingScorer:
+            for k in TOP_KS:
+                with timer() as t:
+                    kept = rank_contexts(list(contexts), query=task_context, top_k=k, scorer=scorer)
+                durations[scorer] += t.seconds()
+                recalls[scorer, k] += [len(relevant.intersection([ids[i] for i in kept])) / len(relevant)]
+
+    logger.info(f"{len(filtered)} filtered pages, mean {np.mean(num_elements):.1f} elements per page")
+    for scorer in RankingScorer:
+        logger.info(
+            f"{scorer.value} ({durations[scorer] / max(len(filtered) * len(TOP_KS), 1) * 1000:.2f}ms per page): "
+            + ", ".join([f"recall@{k} {np.mean(recalls[scorer, k]):.3f}" for k in TOP_KS])
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(CommonConfig.parse_args()))
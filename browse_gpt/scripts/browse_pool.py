@@ -0,0 +1,115 @@
+import sys
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, nullcontext
+from copy import copy
+from typing import List, Tuple
+
+from browse_gpt.config import DriverPoolConfig
+from browse_gpt.browser.chromedriver import wait_until_ready
+from browse_gpt.browser.pool import DriverPool
+from browse_gpt.cache.session import new_session
+from browse_gpt.cache.task import new_task
+from browse_gpt.cache.action import new_action
+from browse_gpt.agent import stream_potential_actions, run_first_action
+from browse_gpt.prefetch import PagePrefetcher
+from browse_gpt.util import timer
+
+logger = logging.getLogger(__name__)
+
+
+"""Read tasks from a file with one task per line, given as `<url>\\t<task description>` or as a task description
+starting from `default_url`"""
+def load_tasks(path: str, default_url: str) -> List[Tuple[str, str]]:
+    tasks = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            url, _, task_description = line.rpartition("\t")
+            tasks += [(url or default_url, task_description)]
+    return tasks
+
+
+"""Run one task in its own session on a leased driver, acting on the first usable filtered element of each page
+until no action succeeds or the step limit is reached. Returns the number of actions run"""
+def run_task(config: DriverPoolConfig, pool: DriverPool, task_idx: int, url: str, task_description: str) -> int:
+    config = copy(config)
+    config.session_id = f"{config.session_id}-{task_idx}"
+    config.url = url
+    config.task_description = task_description
+
+    session_id, _ = new_session(db_client=config.db_client, config=config)
+    task_id, _ = new_task(db_client=config.db_client, session_id=session_id, task_description=task_description)
+    num_actions = 0
+    prefetcher = PagePrefetcher(
+        parser=config.parser,
+        max_nodes=config.max_nodes,
+        ttl=config.prefetch_ttl,
+        max_pages=config.prefetch_max_pages,
+    ) if config.prefetch_links else None
+    with pool.lease() as driver, closing(prefetcher) if prefetcher is not None else nullcontext():
+        parsed_pages = {} if config.incremental_parse else None
+        driver.get(url)
+        while True:
+            wait_until_ready(driver, quiet_window=config.page_quiet_window, timeout=config.page_ready_timeout)
+            with closing(stream_potential_actions(
+                config=config,
+                page_source=driver.page_source,
+                session_id=session_id,
+                task_id=task_id,
+                url=driver.current_url,
+                parsed_pages=parsed_pages,
+                prefetcher=prefetcher,
+            )) as filtered:
+                result = run_first_action(
+                    driver=driver,
+                    config=config,
+                    filtered=((element_id, xpath) for element_id, _, xpath in filtered),
+                    prefetcher=prefetcher,
+                )
+            if result is None:
+                logger.warning(f"Task {task_idx}: failed to interact with any filtered element")
+                break
+            element_id, action_spec, action_description = result
+            new_action(db_client=config.db_client, task_id=task_id, element_id=element_id, action_spec=action_spec, description=action_description)
+            num_actions += 1
+            if num_actions >= config.max_steps:
+                break
+    return num_actions
+
+
+"""Run the tasks in `--task-file` concurrently, one browsing session per task, on a pool of `--num-drivers` browsers"""
+def main(config: DriverPoolConfig):
+    tasks = load_tasks(config.task_file, default_url=config.url)
+    pool = DriverPool(
+        size=config.num_drivers,
+        headless=config.headless,
+        extension_name=config.browser_extension,
+        max_leases=config.driver_max_leases,
+    )
+    failed = False
+    try:
+        with timer() as t, ThreadPoolExecutor(max_workers=config.num_drivers) as executor:
+            futures = [
+                executor.submit(run_task, config, pool, i, url, task_description)
+                for i, (url, task_description) in enumerate(tasks)
+            ]
+            for i, future in enumerate(futures):
+                try:
+                    logger.info(f"Task {i}: ran {future.result()} actions")
+                except Exception as e:
+                    failed = True
+                    logger.error(f"Task {i} failed: {e}")
+        logger.info(f"Ran {len(tasks)} tasks on {config.num_drivers} drivers. ({t.seconds()}s)")
+        logger.info(f"Driver pool: {pool.metrics()}")
+    finally:
+        pool.close()
+        config.db_client.close()
+
+    return int(failed)
+
+
+if __name__ == "__main__":
+    sys.exit(main(DriverPoolConfig.parse_args()))
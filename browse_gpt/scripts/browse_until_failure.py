@@ -1,26 +1,25 @@
 import sys
 import logging
 
-from browse_gpt.db import DBClient
 from browse_gpt.config import BrowingSessionConfig, OverrideOptions
 from browse_gpt.browser.chromedriver import start_driver
 from browse_gpt.processing import get_current_page_context
-from browse_gpt.prompt.interface import describe_selection, filter_context
+from browse_gpt.prompt.interface import describe_selections
 from browse_gpt.cache.util import get_group_context_for_page_id, update_group_description_for_page_id, get_context_for_page_id
 from browse_gpt.cache.session import new_session
 from browse_gpt.cache.page import new_page
-from browse_gpt.cache.element import add_elements, add_filtered_elements, get_filtered_elements
+from browse_gpt.cache.element import add_elements, get_filtered_elements
 from browse_gpt.cache.task import new_task
 from browse_gpt.cache.action import new_action
 from browse_gpt.util import timer, query_user_action
-from browse_gpt.agent import select_and_run_action
+from browse_gpt.agent import run_first_action, stream_filtered_elements
+from browse_gpt.ranking import rank_contexts
 
 logger = logging.getLogger(__name__)
 
 # TODO Run from middles of browsing session and work backward from there
 """
 Thoughts:
-- split context up and filter one chunk at a time
 - additional HTML tree-based filtering to get interactive elements
 - fix same-class groups
     - not finding groups on grubhub
@@ -55,7 +54,7 @@ TODO:
 
 
 def main(config: BrowingSessionConfig):
-    db_client = DBClient(config.db_url)
+    db_client = config.db_client
 
     session_id, _ = new_session(db_client=db_client, config=config)
     task_id, _ = new_task(
@@ -87,11 +86,11 @@ def main(config: BrowingSessionConfig):
             if len(group_ctx) > 0:
                 logger.info(f"Generating descriptions for {len(group_ctx)} same-class element groups...")
                 with timer() as t:
-                    group_element_ids, group_positions, group_descriptions = zip(*[
-                        (group_element_id, group_idx, describe_selection(group_ctx).split("\n")[0])
-                        for group_element_id, group_idx, group_ctx
-                        in group_ctx
-                    ])
+                    group_element_ids, group_positions, group_ctxs = zip(*group_ctx)
+                    group_descriptions = [
+                        description.split("\n")[0]
+                        for description in describe_selections(group_ctxs, max_concurrency=config.llm_max_concurrency)
+                    ]
                 logger.info(f"Done generating group descriptions. ({t.seconds()}s)")
 
                 # update db with element group descriptions
@@ -106,17 +105,20 @@ def main(config: BrowingSessionConfig):
                 *get_context_for_page_id(db_client=db_client, page_id=page_id)
             )
 
-            # query LLM to filter parsed content
+            # keep only the elements most relevant to the task
+            candidates = rank_contexts(page_ctx, query=config.task_description, top_k=config.prerank_top_k, scorer=config.prerank_scorer)
+            element_ids, page_ctx, xpaths = zip(*[(element_ids[i], page_ctx[i], xpaths[i]) for i in candidates])
+
+            # query LLM to filter parsed content, streaming filtered elements so actions can be tried right away
             logger.info("Filtering parsed content...")
-            with timer() as t:
-                filtered_elements = filter_context(ctx=page_ctx, website=config.llm_site_id, task_description=config.task_description)
-                filtered_action_descriptions = [desc for _, desc in filtered_elements]
-                filtered_xpaths = [xpaths[int(ann)] for ann, _ in filtered_elements]
-                filtered_element_ids = [element_ids[int(ann)] for ann, _ in filtered_elements]
-            logger.info(f"Done filtering parsed content. ({t.seconds()}s)")
-
-            # add filtered context to db
-            add_filtered_elements(db_client=db_client, task_id=task_id, filtered_element_ids=filtered_element_ids, filtered_descriptions=filtered_action_descriptions)
+            filtered_elements = stream_filtered_elements(
+                config=config,
+                task_id=task_id,
+                element_ids=element_ids,
+                page_ctx=page_ctx,
+                xpaths=xpaths,
+            )
+            filtered = ((element_id, xpath) for element_id, _, xpath in filtered_elements)
         
         else:
             logger.info("Retrieved page from cache.")
@@ -127,7 +129,7 @@ def main(config: BrowingSessionConfig):
                 task_id=task_id,
                 page_id=page_id,
             )
-            filtered_element_ids, filtered_xpaths = zip(*filtered_elements) if filtered_elements else ([], [])
+            filtered = [(element_id, xpath) for element_id, _, xpath in filtered_elements]
 
         action_description = None
         if config.allow_override == OverrideOptions.ALWAYS:
@@ -136,16 +138,19 @@ def main(config: BrowingSessionConfig):
         if not action_description:
             # attempt to interact with filtered elements
             try:
-                element_id, action_spec, action_description = select_and_run_action(
+                element_id, action_spec, action_description = run_first_action(
                     driver=driver,
                     config=config,
-                    element_ids=filtered_element_ids, 
-                    xpaths=filtered_xpaths,
+                    filtered=filtered,
                 )
                 new_action(db_client=db_client, task_id=task_id, element_id=element_id, action_spec=action_spec, description=action_description)
 
             except TypeError:
                 pass
+
+        # finish reading the filtering response so its result is cached even if the action didn't need all of it
+        for _ in filtered:
+            pass
         
         if not config.allow_override == OverrideOptions.ON_FAILURE:
             action_description = query_user_action()
@@ -2,14 +2,13 @@ import sys
 import logging
 
 from browse_gpt.config import CommonConfig
-from browse_gpt.db import DBClient
 from browse_gpt.cache.session import clear_session_cache
 
 logger = logging.getLogger(__name__)
 
 
 def main(config: CommonConfig):
-    db_client = DBClient(config.db_url)
+    db_client = config.db_client
 
     logger.info(f"Deleting cache for session '{config.session_id}'")
     del_count = clear_session_cache(db_client=db_client, session_tag=config.session_id)
@@ -1,7 +1,6 @@
 import sys
 from bs4 import BeautifulSoup
 
-from browse_gpt.db import DBClient
 import browse_gpt.model as orm
 from browse_gpt.config import ParsePageConfig
 from browse_gpt.browser.chromedriver import start_driver
@@ -9,11 +8,12 @@ from browse_gpt.cache.util import (
     save_to_cache,
     PAGE_HTML_FILENAME,
 )
-from browse_gpt.processing import recurse_get_context, get_decorated_elem, DecoratedSoupGroup
+from browse_gpt.processing import recurse_get_context, get_decorated_elem
+from browse_gpt.cache.element import add_elements
 
 
 def main(config: ParsePageConfig):
-    db_client = DBClient(config.db_url)
+    db_client = config.db_client
 
     driver = start_driver()
     driver.get(config.url)
@@ -45,41 +45,7 @@ def main(config: ParsePageConfig):
     _, elems, _ = recurse_get_context(driver=driver, ds=ds)
 
     # add elements to db
-    with db_client.transaction() as db_session:
-        for i, e in enumerate(elems):
-            if isinstance(e, DecoratedSoupGroup):
-                context = "\n".join([e_.context for e_ in e.elems])
-                parent_element = orm.Element(
-                    page_id=page_id,
-                    xpath=e.group_xpath,
-                    element_position=i,
-                    outer_html=str(e.soup.parent),  # TODO Change: currently DecoratedSoupGroup sets soup to first element
-                    is_leaf=False,
-                    context=context,
-                )
-                db_session.add(parent_element)
-                db_session.commit()
-
-                for j, e_ in enumerate(e.elems):
-                    element = orm.Element(
-                        page_id=page_id,
-                        parent_id=parent_element.id,
-                        xpath=e_.xpath,
-                        element_position=j,
-                        outer_html=str(e_.soup),
-                        is_root=False,
-                        context=e_.context,
-                    )
-                    db_session.add(element)
-            else:
-                element = orm.Element(
-                    page_id=page_id,
-                    element_position=i,
-                    xpath=e.xpath,
-                    outer_html=str(e.soup),
-                    context=e.context,
-                )
-                db_session.add(element)
+    add_elements(db_client=db_client, page_id=page_id, elements=elems)
 
     return 0
 
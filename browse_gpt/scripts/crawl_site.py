@@ -0,0 +1,258 @@
+import sys
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from glob import glob
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse
+import lxml.html
+import numpy as np
+
+from browse_gpt.config import CrawlSiteConfig, ParserBackend
+from browse_gpt.browser.chromedriver import wait_until_ready
+from browse_gpt.browser.pool import DriverPool
+from browse_gpt.cache.session import new_session
+from browse_gpt.cache.page import add_pages, get_page_url_hashes
+from browse_gpt.cache.element import ElementRows, add_element_rows, get_element_rows
+from browse_gpt.cache.util import load_from_path, get_file_url
+from browse_gpt.model import Base
+from browse_gpt.processing import parse_page_source
+from browse_gpt.util import timer, hash_page_url
+
+logger = logging.getLogger(__name__)
+
+CRAWL_SCHEMES = ["http", "https", "file"]
+STAGES = ["fetch", "parse", "write"]
+HISTOGRAM_BUCKETS = 8
+HISTOGRAM_WIDTH = 40
+
+
+"""Latencies of each crawl stage and counts of crawled pages"""
+class CrawlStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.num_pages = 0
+        self.num_elements = 0
+        self.num_failed = 0
+
+    def add(self, stage: str, seconds: float):
+        self.latencies[stage] += [seconds]
+
+    def report(self, seconds: float) -> str:
+        lines = [
+            f"Crawled {self.num_pages} pages ({self.num_elements} elements, {self.num_failed} failed) in {seconds:.2f}s: "
+            f"{self.num_pages / seconds * 60 if seconds > 0 else 0.:.1f} pages/min"
+        ]
+        for stage in STAGES:
+            latencies = np.array(self.latencies[stage])
+            if len(latencies) == 0:
+                continue
+            p50, p90 = np.percentile(latencies, [50, 90])
+            per = " per batch" if stage == "write" else ""
+            lines += [f"{stage}{per}: n={len(latencies)} p50={p50:.3f}s p90={p90:.3f}s max={latencies.max():.3f}s"]
+            # equal samples, e.g. a single write batch, have no spread to bucket
+            if np.ptp(latencies) == 0:
+                continue
+            counts, edges = np.histogram(latencies, bins=HISTOGRAM_BUCKETS)
+            for count, start, end in zip(counts, edges[:-1], edges[1:]):
+                bar = "#" * int(np.ceil(count / counts.max() * HISTOGRAM_WIDTH))
+                lines += [f"  {start:8.3f}-{end:8.3f}s {count:6d} {bar}"]
+        return "\n".join(lines)
+
+
+"""Links to follow from a page, resolved against its url and without fragments"""
+def extract_links(page_source: str, url: str) -> List[str]:
+    try:
+        doc = lxml.html.fromstring(page_source)
+    except Exception:
+        return []
+    links = []
+    for a in doc.iter("a"):
+        href = a.get("href")
+        if not href or href.startswith("#"):
+            continue
+        link = urldefrag(urljoin(url, href.strip()))[0]
+        if urlparse(link).scheme in CRAWL_SCHEMES:
+            links += [link]
+    return links
+
+
+"""Parse a page into element rows and links. Runs in a parse worker process, so only plain data is returned"""
+def parse_page(page_source: str, url: str, parser: ParserBackend, max_nodes: int) -> Tuple[ElementRows, List[str], float]:
+    with timer() as t:
+        elements = parse_page_source(page_source, parser=parser, max_nodes=max_nodes, compact=True)
+        rows = get_element_rows(elements)
+        links = extract_links(page_source, url)
+    return rows, links, t.seconds()
+
+
+def fetch_static_page(url: str) -> Tuple[str, str]:
+    return load_from_path(urlparse(url).path), url
+
+
+"""Fetch pages on leased drivers, so up to `pool.size` pages load at once"""
+def fetch_with_pool(pool: DriverPool) -> Callable[[str], Tuple[str, str]]:
+    def fetch(url: str) -> Tuple[str, str]:
+        with pool.lease() as driver:
+            driver.get(url)
+            wait_until_ready(driver)
+            return driver.page_source, driver.current_url
+    return fetch
+
+
+def timed_fetch(fetch: Callable[[str], Tuple[str, str]], url: str) -> Tuple[str, str, float]:
+    with timer() as t:
+        page_source, final_url = fetch(url)
+    return page_source, final_url, t.seconds()
+
+
+"""Add a batch of crawled pages and their elements, with one statement for pages and one for their root elements.
+Pages the session already has are skipped. Returns the number of pages and elements added"""
+def write_pages(config: CrawlSiteConfig, session_id: int, batch: List[Tuple[str, str, ElementRows]]) -> Tuple[int, int, float]:
+    with timer() as t:
+        page_ids = add_pages(config=config, session_id=session_id, pages=[(url, page_source) for url, page_source, _ in batch])
+        page_rows = [(page_id, rows) for (page_id, cached), (_, _, rows) in zip(page_ids, batch) if not cached]
+        element_ids = add_element_rows(db_client=config.db_client, page_rows=page_rows)
+    return len(page_rows), sum(len(ids) for ids in element_ids), t.seconds()
+
+
+def load_seeds(config: CrawlSiteConfig) -> List[str]:
+    if config.static_dir:
+        paths = sorted(glob(os.path.join(config.static_dir, "**", "*.html"), recursive=True))
+        return [get_file_url(os.path.abspath(path)) for path in paths]
+    seeds = [config.url]
+    if config.url_file:
+        with open(config.url_file, "r") as f:
+            seeds += [line.strip() for line in f if line.strip()]
+    return seeds
+
+
+"""Crawl from a url frontier breadth first, up to `--max-pages` pages and `--max-depth` links from the seeds.
+Pages are fetched by `--num-drivers` concurrent fetchers, parsed in a pool of `--num-parse-workers` processes and
+written in batches of `--write-batch-size` pages on a writer thread, so the stages overlap.
+Urls are deduplicated by hash_url without fragments, including urls the session already has pages for"""
+def crawl(config: CrawlSiteConfig, session_id: int, seeds: List[str], fetch: Callable[[str], Tuple[str, str]]) -> CrawlStats:
+    stats = CrawlStats()
+    sites = {urlparse(url).netloc for url in seeds}
+    # static crawls stay within the directory, since pages saved from a site link to paths that weren't saved
+    static_root = get_file_url(os.path.abspath(config.static_dir)) + "/" if config.static_dir else None
+    seen = get_page_url_hashes(config=config, session_id=session_id)
+    frontier = deque()
+    for url in seeds:
+        url = urldefrag(url)[0]
+        if hash_page_url(url) not in seen:
+            seen.add(hash_page_url(url))
+            frontier.append((url, 0))
+
+    # (stage, url, depth, page source) for each fetch and parse in flight, and (stage, batch) for each write
+    pending: Dict[Future, Tuple] = {}
+    num_fetching = 0
+    num_scheduled = 0
+    batch = []
+
+    # parse workers are spawned rather than forked, since fetcher and db pool threads are already running
+    with ThreadPoolExecutor(max_workers=config.num_drivers, thread_name_prefix="crawl-fetch") as fetch_executor, \
+            ProcessPoolExecutor(max_workers=config.num_parse_workers, mp_context=multiprocessing.get_context("spawn")) as parse_executor, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="crawl-write") as write_executor:
+
+        def submit_write():
+            pending[write_executor.submit(write_pages, config, session_id, batch)] = ("write", batch)
+
+        while frontier or pending:
+            while frontier and num_fetching < config.num_drivers and num_scheduled < config.max_pages:
+                url, depth = frontier.popleft()
+                pending[fetch_executor.submit(timed_fetch, fetch, url)] = ("fetch", url, depth, None)
+                num_fetching += 1
+                num_scheduled += 1
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, *task = pending.pop(future)
+                if stage == "fetch":
+                    num_fetching -= 1
+                if future.exception() is not None:
+                    if stage == "write":
+                        stats.num_failed += len(task[0])
+                        logger.warning(f"Failed to write {len(task[0])} pages: {future.exception()}")
+                    else:
+                        stats.num_failed += 1
+                        logger.warning(f"Failed to {stage} {task[0]}: {future.exception()}")
+                    continue
+                if stage != "write":
+                    url, depth, page_source = task
+
+                if stage == "fetch":
+                    page_source, final_url, seconds = future.result()
+                    stats.add("fetch", seconds)
+                    # redirected pages are stored under the url they land on
+                    if final_url != url:
+                        final_url = urldefrag(final_url)[0]
+                        seen.add(hash_page_url(final_url))
+                    pending[parse_executor.submit(parse_page, page_source, final_url, config.parser, config.max_nodes)] = ("parse", final_url, depth, page_source)
+
+                elif stage == "parse":
+                    rows, links, seconds = future.result()
+                    stats.add("parse", seconds)
+                    batch += [(url, page_source, rows)]
+                    if len(batch) >= config.write_batch_size:
+                        submit_write()
+                        batch = []
+                    if depth >= config.max_depth:
+                        continue
+                    for link in links:
+                        if config.same_site and urlparse(link).netloc not in sites:
+                            continue
+                        if static_root is not None and not link.startswith(static_root):
+                            continue
+                        if hash_page_url(link) not in seen:
+                            seen.add(hash_page_url(link))
+                            frontier.append((link, depth + 1))
+
+                else:
+                    num_pages, num_elements, seconds = future.result()
+                    stats.add("write", seconds)
+                    stats.num_pages += num_pages
+                    stats.num_elements += num_elements
+
+            if batch and not frontier and all(stage == "write" for stage, *_ in pending.values()):
+                submit_write()
+                batch = []
+            if num_scheduled >= config.max_pages:
+                frontier.clear()
+
+    return stats
+
+
+"""Warm the page and element cache for a site by crawling it. With `--static-dir`, pages under the directory
+(e.g. example/) are read from disk instead of loaded in a browser, so the crawl runs offline"""
+def main(config: CrawlSiteConfig):
+    if config.db_client.engine.dialect.name == "sqlite":
+        Base.metadata.create_all(config.db_client.engine)
+    session_id, _ = new_session(db_client=config.db_client, config=config)
+    seeds = load_seeds(config)
+
+    pool = None
+    if config.static_dir:
+        fetch = fetch_static_page
+    else:
+        pool = DriverPool(size=config.num_drivers, headless=config.headless)
+        fetch = fetch_with_pool(pool)
+
+    try:
+        with timer() as t:
+            stats = crawl(config=config, session_id=session_id, seeds=seeds, fetch=fetch)
+        logger.info(stats.report(t.seconds()))
+        if pool is not None:
+            logger.info(f"Driver pool: {pool.metrics()}")
+    finally:
+        if pool is not None:
+            pool.close()
+        config.db_client.close()
+
+    return int(stats.num_failed > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main(CrawlSiteConfig.parse_args()))
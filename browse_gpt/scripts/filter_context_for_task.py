@@ -12,14 +12,13 @@ from browse_gpt.cache.util import (
 )
 from browse_gpt.cache.util import get_context_for_page
 from browse_gpt.prompt.interface import filter_context
-from browse_gpt.db import DBClient
 from browse_gpt.model import Task, Session, FilteredElement
 
 logger = logging.getLogger(__name__)
 
 
 def main(config: TaskExecutionConfig):
-    db_client = DBClient(config.db_url)
+    db_client = config.db_client
 
     # add task to db
     with db_client.transaction() as db_session:
@@ -38,7 +37,13 @@ def main(config: TaskExecutionConfig):
         *get_context_for_page(db_client=db_client, url_hash=config.site_id)
     )
 
-    filtered_elements = filter_context(ctx=page_ctx, website=config.llm_site_id, task_description=config.task_description)
+    filtered_elements = filter_context(
+        ctx=page_ctx,
+        website=config.llm_site_id,
+        task_description=config.task_description,
+        max_tokens=config.llm_max_prompt_tokens,
+        max_concurrency=config.llm_max_concurrency,
+    )
     filtered_xpaths = [xpaths[int(ann)] for ann, _ in filtered_elements]
     filtered_element_ids = [element_ids[int(ann)] for ann, _ in filtered_elements]
 
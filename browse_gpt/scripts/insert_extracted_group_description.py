@@ -1,12 +1,11 @@
 import sys
 from browse_gpt.config import ParsePageConfig
-from browse_gpt.db import DBClient
 from browse_gpt.cache.util import get_group_context_for_page, update_group_description_for_page
 from browse_gpt.prompt.interface import describe_selection
 
 
 def main(config: ParsePageConfig):
-    db_client = DBClient(config.db_url)
+    db_client = config.db_client
 
     group_context = get_group_context_for_page(db_client=db_client, url_hash=config.site_id)
     group_positions, group_descriptions = zip(*[
@@ -11,7 +11,6 @@ from datetime import datetime
 import json
 import multiprocessing as mp
 
-from browse_gpt.db import DBClient
 from browse_gpt.config import BrowingSessionConfig
 from browse_gpt.browser.chromedriver import start_driver
 from browse_gpt.processing import get_current_page_context
@@ -82,7 +81,13 @@ def get_potential_actions(session_id: int, task_id: int, url: str):
         # query LLM to filter parsed content
         logger.info("Filtering parsed content...")
         with timer() as t:
-            filtered_elements = filter_context(ctx=page_ctx, website=config.llm_site_id, task_description=config.task_description)
+            filtered_elements = filter_context(
+                ctx=page_ctx,
+                website=config.llm_site_id,
+                task_description=config.task_description,
+                max_tokens=config.llm_max_prompt_tokens,
+                max_concurrency=config.llm_max_concurrency,
+            )
             filtered_action_descriptions = [desc for _, desc in filtered_elements]
             filtered_xpaths = [xpaths[int(ann)] for ann, _ in filtered_elements]
             filtered_element_ids = [element_ids[int(ann)] for ann, _ in filtered_elements]
@@ -167,5 +172,5 @@ if __name__ == "__main__":
     # these vars need to be global so subprocesses can reference them
     config: BrowingSessionConfig = BrowingSessionConfig.parse_args()
     driver = start_driver()
-    db_client = DBClient(config.db_url)
+    db_client = config.db_client
     sys.exit(main())
@@ -1,7 +1,5 @@
 import sys
 import os.path
-from selenium.webdriver.common.by import By
-from selenium.common.exceptions import NoSuchElementException
 import logging
 
 from browse_gpt.browser.chromedriver import start_driver
@@ -14,15 +12,14 @@ from browse_gpt.cache.util import (
 from browse_gpt.cache.util import get_filtered_context_for_page
 from browse_gpt.cache.action import ActionSpec, ElementActionType
 from browse_gpt.prompt.interface import get_text_input_for_field
-from browse_gpt.db import DBClient
 from browse_gpt.model import Task, Session, Page, Action
-from browse_gpt.processing import extract_first_interactive_from_outer_html, is_text_input
+from browse_gpt.processing import resolve_first_interactive, is_text_input
 
 logger = logging.getLogger(__name__)
 
 
 def main(config: TaskExecutionConfig):
-    db_client = DBClient(config.db_url)
+    db_client = config.db_client
 
     # get xpaths for filtered elements
     element_ids, filtered_xpaths = zip(*
@@ -51,12 +48,12 @@ def main(config: TaskExecutionConfig):
     driver = start_driver()
     driver.get(f"file://{os.path.join(get_workdir(), path)}")
 
+    # resolve interactive elements for all filtered xpaths in one round trip
+    resolved = resolve_first_interactive(driver, filtered_xpaths)
+
     # try to execute for action for filtered xpaths
-    for i, (element_id, xpath) in enumerate(zip(element_ids, filtered_xpaths)):
-        e = driver.find_element(by=By.XPATH, value=xpath)
-        try:
-            interactive_e = extract_first_interactive_from_outer_html(e)
-        except NoSuchElementException:
+    for i, (element_id, xpath, interactive_e) in enumerate(zip(element_ids, filtered_xpaths, resolved)):
+        if interactive_e is None:
             logger.warning(f"Failed to find interactive element at xpath: {xpath}")
             continue
         input_text = None
@@ -82,7 +79,7 @@ def main(config: TaskExecutionConfig):
 
         # run the action    
         try:
-            action_spec.run(driver=driver, e=interactive_e)
+            action_spec.run(driver=driver, e=interactive_e.element)
         except Exception as e:
             logger.warning(f"Failed to run action: {e}")
 
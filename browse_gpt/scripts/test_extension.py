@@ -12,8 +12,9 @@ import multiprocessing as mp
 from typing import List
 
 from browse_gpt.db import DBClient
-from browse_gpt.browser.chromedriver import start_driver
+from browse_gpt.browser.chromedriver import start_driver, wait_until_ready
 from browse_gpt.config import ParsePageConfig
+from browse_gpt.util import timer
 
 logger = logging.getLogger(__name__)
 
@@ -26,14 +27,10 @@ def wait_for_request(port: int, q: mp.Queue):
     q.put_nowait(RequestHandler.browser_response_stack[0])
 
 
-def wait_for_page_load(driver: Chrome, poll_interval: float = 0.1) -> Tuple[float, str]:
-    source = None
-    t = 0
-    while source != driver.page_source:
-        source = driver.page_source
-        t += poll_interval
-        time.sleep(poll_interval)
-    return t, source
+def wait_for_page_load(driver: Chrome) -> Tuple[float, str]:
+    with timer() as t:
+        wait_until_ready(driver)
+    return t.seconds(), driver.page_source
 
 
 def wait_for_page_ready(driver: Chrome):
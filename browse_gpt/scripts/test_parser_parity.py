@@ -0,0 +1,60 @@
+import sys
+import logging
+from typing import List, Tuple
+from bs4 import BeautifulSoup
+
+from browse_gpt.config import BenchmarkConfig, ParserBackend
+from browse_gpt.cache.util import list_cached_pages, load_from_path
+from browse_gpt.processing import DecoratedSoup, parse_page_source
+from browse_gpt.util import timer
+
+logger = logging.getLogger(__name__)
+
+
+"""Serializers differ in escaping, void tags and how whitespace around unwrapped elements is merged,
+so compare outer HTML by its tag sequence and whitespace-collapsed text"""
+def normalize_outer_html(outer_html: str) -> Tuple[List[str], str]:
+    soup = BeautifulSoup(outer_html, "lxml")
+    return [t.name for t in soup.find_all(True)], " ".join(soup.get_text().split())
+
+
+def compare_elements(expected: List[DecoratedSoup], actual: List[DecoratedSoup]) -> List[str]:
+    mismatches = []
+    if len(expected) != len(actual):
+        mismatches += [f"element count: {len(expected)} != {len(actual)}"]
+    for i, (e, a) in enumerate(zip(expected, actual)):
+        if e.xpath != a.xpath:
+            mismatches += [f"{i} xpath: {e.xpath} != {a.xpath}"]
+        elif e.context != a.context:
+            mismatches += [f"{i} context at {e.xpath}: {e.context!r} != {a.context!r}"]
+        elif normalize_outer_html(e.outer_html) != normalize_outer_html(a.outer_html):
+            mismatches += [f"{i} outer html at {e.xpath}"]
+    return mismatches
+
+
+def main(config: BenchmarkConfig):
+    failed = False
+    for path in list_cached_pages(config.cache_dir):
+        page_source = load_from_path(path)
+        durations = {}
+        elems = {}
+        for parser in ParserBackend:
+            with timer() as t:
+                for _ in range(config.num_iter):
+                    elems[parser] = parse_page_source(page_source, parser=parser)
+            durations[parser] = t.seconds() / config.num_iter
+
+        mismatches = compare_elements(elems[ParserBackend.BS4], elems[ParserBackend.LXML])
+        for m in mismatches[:10]:
+            logger.error(m)
+        failed = failed or bool(mismatches)
+        logger.info(
+            f"{path}: {len(elems[ParserBackend.BS4])} elements, {len(mismatches)} mismatches, "
+            + ", ".join([f"{parser.value}: {d:.4f}s" for parser, d in durations.items()])
+        )
+
+    return int(failed)
+
+
+if __name__ == "__main__":
+    sys.exit(main(BenchmarkConfig.parse_args()))
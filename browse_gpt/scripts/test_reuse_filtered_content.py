@@ -0,0 +1,72 @@
+import sys
+import logging
+from uuid import uuid4
+
+from browse_gpt.config import BrowingSessionConfig, LLMBackendOption
+from browse_gpt.cache.session import new_session
+from browse_gpt.cache.task import new_task
+from browse_gpt.agent import get_potential_actions
+from browse_gpt.llm.openai_api import get_backend, set_response_cache
+from browse_gpt.model import Base
+
+logger = logging.getLogger(__name__)
+
+TASK_DESCRIPTION = "search for a pepperoni pizza and add it to the cart"
+PRERANK_TOP_K = 3
+# the link to the cart ranks below the pizza buttons on the first page, so pre-ranking leaves it out of the prompt
+FIRST_PAGE = """<html><body><div>
+<button>Add pepperoni pizza to cart</button>
+<button>Search pepperoni pizza</button>
+<button>Pepperoni pizza deals</button>
+<a href="/cart">View cart</a>
+</div></body></html>"""
+# on the second page the same link ranks high enough to be filtered
+SECOND_PAGE = """<html><body>
+<p>About us</p>
+<a href="/cart">View cart</a>
+<a href="/jobs">Careers</a>
+</body></html>"""
+EXPECTED_CONTEXT = "View cart"
+
+
+"""Check that elements pre-ranking dropped on one page are not reused as rejected by the LLM on later pages,
+where they should still be filtered. Runs offline against the local backend and a sqlite `--db-url`"""
+def main(config: BrowingSessionConfig):
+    if config.llm_backend != LLMBackendOption.LOCAL:
+        logger.warning("Testing against the OpenAI API, pass `--llm-backend local` to run offline")
+    if config.db_client.engine.dialect.name == "sqlite":
+        Base.metadata.create_all(config.db_client.engine)
+    # cached responses would skip the requests counted below
+    set_response_cache(None)
+    config.llm_cache = False
+    config.task_description = TASK_DESCRIPTION
+    config.prerank_top_k = PRERANK_TOP_K
+    config.reuse_filtered_content = True
+    config.session_id = f"test-{uuid4().hex}"
+
+    session_id, _ = new_session(db_client=config.db_client, config=config)
+    task_id, _ = new_task(db_client=config.db_client, session_id=session_id, task_description=config.task_description)
+
+    failed = False
+    for i, page_source in enumerate([FIRST_PAGE, SECOND_PAGE]):
+        num_requests = getattr(get_backend(), "num_requests", 0)
+        _, elems, _ = get_potential_actions(
+            config=config,
+            page_source=page_source,
+            session_id=session_id,
+            task_id=task_id,
+            url=f"http://example.com/{config.session_id}/{i}",
+        )
+        contexts = [e.context for e in elems]
+        logger.info(f"page {i}: {getattr(get_backend(), 'num_requests', 0) - num_requests} LLM requests, filtered {contexts}")
+
+    if EXPECTED_CONTEXT not in contexts:
+        logger.error(f"{EXPECTED_CONTEXT!r} was dropped by pre-ranking on the first page and not filtered on the second")
+        failed = True
+
+    config.db_client.close()
+    return int(failed)
+
+
+if __name__ == "__main__":
+    sys.exit(main(BrowingSessionConfig.parse_args()))
@@ -2,13 +2,14 @@ import sys
 import logging
 import concurrent.futures
 import json
+from contextlib import closing
 
 from browse_gpt.config import BrowingSessionConfig
 from browse_gpt.browser.chromedriver import start_driver, wait_until_ready
 from browse_gpt.cache.session import new_session
 from browse_gpt.cache.task import new_task
 from browse_gpt.cache.action import new_action
-from browse_gpt.agent import get_potential_actions, get_action_metadata
+from browse_gpt.agent import stream_potential_actions, get_first_action_metadata
 
 logger = logging.getLogger(__name__)
 
@@ -22,27 +23,24 @@ def main(config: BrowingSessionConfig):
     )
 
     driver = start_driver()
+    parsed_pages = {} if config.incremental_parse else None
 
     # main browsing loop
     url = config.url
     while True:  
         driver.get(url)
-        wait_until_ready(driver)
+        wait_until_ready(driver, quiet_window=config.page_quiet_window, timeout=config.page_ready_timeout)
 
-        filtered_ids, filtered_elems, filtered_xpaths = get_potential_actions(
+        # start on filtered elements as the LLM streams them back
+        with closing(stream_potential_actions(
             config=config,
             page_source=driver.page_source,
             session_id=session_id,
             task_id=task_id,
             url=url,
-        )
-
-        element_id, _, action_metadata = get_action_metadata(
-            config=config,
-            element_ids=filtered_ids,
-            elements=filtered_elems,
-            xpaths=filtered_xpaths,
-        )
+            parsed_pages=parsed_pages,
+        )) as filtered:
+            element_id, _, action_metadata = get_first_action_metadata(config=config, filtered=filtered)
 
         if element_id is not None:
             new_action(db_client=config.db_client, task_id=task_id, element_id=element_id, action_spec=action_metadata)
@@ -1,6 +1,9 @@
-from typing import List, Tuple
+from typing import Any, Callable, List, Tuple
+from contextlib import contextmanager
 from hashlib import md5
+from urllib.parse import urldefrag
 from datetime import datetime, timedelta
+from threading import Lock
 
 
 def query_user_action():
@@ -11,6 +14,16 @@ def hash_url(url: str):
     return md5(url.split("//")[1].encode("utf-8")).hexdigest()
 
 
+"""Hash of the document a url loads. Fragments don't change the document, so they are dropped"""
+def hash_page_url(url: str):
+    return hash_url(urldefrag(url)[0])
+
+
+# matches postgres md5(text) for UTF-8 databases
+def hash_text(text: str):
+    return md5(text.encode("utf-8")).hexdigest()
+
+
 def timer() -> "TimerContext":
     return TimerContext()
 
@@ -48,3 +61,36 @@ class TimerContext:
 
     def __exit__(self, *_):
         self.timer.end()
+
+
+"""Start and end of named stages, in seconds since timing started. Stages may run concurrently on other threads,
+so the summary shows how they overlapped"""
+class StageTimings:
+    def __init__(self):
+        self.start_time = datetime.utcnow()
+        self.stages: List[Tuple[str, float, float]] = []
+        self.lock = Lock()
+
+    def seconds(self) -> float:
+        return (datetime.utcnow() - self.start_time).total_seconds()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = self.seconds()
+        try:
+            yield
+        finally:
+            end = self.seconds()
+            with self.lock:
+                self.stages += [(name, start, end)]
+
+    def timed(self, name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        def timed_func(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return timed_func
+
+    def summary(self) -> str:
+        with self.lock:
+            stages = sorted(self.stages, key=lambda s: s[1])
+        return ", ".join([f"{name} {start:.3f}-{end:.3f}s" for name, start, end in stages] + [f"total {self.seconds():.3f}s"])
@@ -0,0 +1,33 @@
+"""
+add evaluated elements to tell elements the LLM rejected from ones it never saw
+
+Revision ID: 5b8e1f07c2d4
+Down revision ID: 9c41d2e8a6f3
+Created date: 2026-10-18 16:05:12.204871+00:00
+"""
+
+import sqlalchemy as sa
+import alembic.op as op
+
+
+revision = '5b8e1f07c2d4'
+down_revision = '9c41d2e8a6f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # elements filtered before this table existed are not backfilled, since which of them reached the LLM
+    # is unknown. Their contents are filtered again when seen on later pages
+    op.create_table(
+        "evaluated_elements",
+        sa.Column("id", sa.BigInteger, primary_key=True),
+        sa.Column("task_id", sa.BigInteger, sa.ForeignKey("tasks.id"), nullable=False),
+        sa.Column("element_id", sa.BigInteger, sa.ForeignKey("elements.id"), nullable=False),
+    )
+    op.create_unique_constraint("evaluated_elements_task_id_element_id_uix", "evaluated_elements", ["task_id", "element_id"])
+    op.create_index("ix_evaluated_elements_element_id", "evaluated_elements", ["element_id"])
+
+
+def downgrade():
+    op.drop_table("evaluated_elements")
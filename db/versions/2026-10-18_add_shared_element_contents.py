@@ -0,0 +1,64 @@
+"""
+add shared element contents deduplicated by subtree hash
+
+Revision ID: 9c41d2e8a6f3
+Down revision ID: 3e207c37234b
+Created date: 2026-10-18 15:40:21.730512+00:00
+"""
+
+import sqlalchemy as sa
+import alembic.op as op
+
+
+revision = '9c41d2e8a6f3'
+down_revision = '3e207c37234b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "element_contents",
+        sa.Column("id", sa.BigInteger, primary_key=True),
+        sa.Column("content_hash", sa.Text, nullable=False),
+        sa.Column("outer_html", sa.Text, nullable=False),
+        sa.Column("context", sa.Text, nullable=False),
+        sa.UniqueConstraint("content_hash", name="element_contents_content_hash_key"),
+    )
+    op.add_column("elements", sa.Column("content_id", sa.BigInteger, sa.ForeignKey("element_contents.id")))
+
+    # existing elements have no subtree hash, so key them the way cache.element.get_content_hash does without one
+    op.execute("""
+        INSERT INTO element_contents (content_hash, outer_html, context)
+        SELECT DISTINCT ON (content_hash) content_hash, outer_html, context
+        FROM (
+            SELECT md5(md5(outer_html) || E'\\n' || context) AS content_hash, outer_html, context
+            FROM elements
+        ) hashed
+    """)
+    op.execute("""
+        UPDATE elements
+        SET content_id = element_contents.id
+        FROM element_contents
+        WHERE element_contents.content_hash = md5(md5(elements.outer_html) || E'\\n' || elements.context)
+    """)
+    op.alter_column("elements", "content_id", nullable=False)
+    op.create_index("ix_elements_content_id", "elements", ["content_id"])
+    op.drop_column("elements", "outer_html")
+    op.drop_column("elements", "context")
+
+
+def downgrade():
+    op.add_column("elements", sa.Column("outer_html", sa.Text))
+    op.add_column("elements", sa.Column("context", sa.Text))
+    op.execute("""
+        UPDATE elements
+        SET outer_html = element_contents.outer_html, context = element_contents.context
+        FROM element_contents
+        WHERE element_contents.id = elements.content_id
+    """)
+    op.alter_column("elements", "outer_html", nullable=False)
+    op.alter_column("elements", "context", nullable=False)
+    op.drop_index("ix_elements_content_id", "elements")
+    op.drop_column("elements", "content_id")
+    op.drop_table("element_contents")
@@ -0,0 +1,31 @@
+"""
+add task context hash for task lookup by description
+
+Revision ID: 3e207c37234b
+Down revision ID: 8527a0419ed6
+Created date: 2026-10-18 15:12:06.418233+00:00
+"""
+
+import sqlalchemy as sa
+import alembic.op as op
+
+
+revision = '3e207c37234b'
+down_revision = '8527a0419ed6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # tasks are looked up by description, so index a hash of it rather than the full text
+    op.add_column("tasks", sa.Column("context_hash", sa.Text))
+    op.execute("UPDATE tasks SET context_hash = md5(context)")
+    op.create_index("ix_tasks_context_hash", "tasks", ["context_hash"])
+
+    # filtered_elements(task_id, element_id) is already covered by the index backing
+    # filtered_elements_task_id_element_id_uix, which is also the ON CONFLICT target for upserts
+
+
+def downgrade():
+    op.drop_index("ix_tasks_context_hash", "tasks")
+    op.drop_column("tasks", "context_hash")